@@ -0,0 +1,135 @@
+"""Deliver queued budget alerts from each shard's outbox.
+
+Usage: python alerts.py
+
+The expense write paths only insert rows into alert_outbox; a dispatcher
+thread started by the app sends them through the configured sender, so
+adding an expense never waits on delivery.
+"""
+import logging
+import os
+import threading
+import database as db
+import sharding
+
+logger = logging.getLogger(__name__)
+
+# Senders deliver one alert to one user. Select one with
+# FINANCE_ALERT_SENDER, or call use_sender() in tests.
+SENDERS = {}
+
+def register_sender(name):
+    """Register a sender class under a configuration name"""
+    def decorator(cls):
+        SENDERS[name] = cls
+        return cls
+    return decorator
+
+@register_sender('log')
+class LogSender:
+    """Write alerts to the application log"""
+
+    def send(self, user, message):
+        logger.info("Budget alert for %s: %s", user['username'], message)
+        return True
+
+@register_sender('memory')
+class MemorySender:
+    """Keep alerts in a list, for tests and load tests"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, user, message):
+        self.sent.append((user['id'], message))
+        return True
+
+@register_sender('twilio')
+class TwilioSender:
+    """Send alerts by SMS to the user's phone number through Twilio"""
+
+    def __init__(self):
+        from twilio.rest import Client
+        self.client = Client(os.environ['TWILIO_ACCOUNT_SID'], os.environ['TWILIO_AUTH_TOKEN'])
+        self.from_number = os.environ['TWILIO_FROM_NUMBER']
+
+    def send(self, user, message):
+        if not user.get('phone'):
+            # Nothing to deliver to; not worth retrying
+            return False
+        self.client.messages.create(body=message, from_=self.from_number, to=user['phone'])
+        return True
+
+_sender = None
+
+def get_sender():
+    """Get the active sender, creating the configured one on first use"""
+    global _sender
+    if _sender is None:
+        _sender = SENDERS[os.environ.get('FINANCE_ALERT_SENDER', 'log')]()
+    return _sender
+
+def use_sender(name):
+    """Switch to another sender"""
+    global _sender
+    _sender = SENDERS[name]()
+    return _sender
+
+MAX_ATTEMPTS = 5
+
+def dispatch_shard(shard, batch_size=100):
+    """Send one shard's pending alerts and return how many were sent"""
+    sender = get_sender()
+    conn = sharding.connect_shard(shard)
+    pending = conn.execute('''
+        SELECT id, user_id, message, attempts FROM alert_outbox
+        WHERE status = 'pending' ORDER BY id LIMIT ?
+    ''', (batch_size,)).fetchall()
+    sent = 0
+    for alert in pending:
+        user = db.get_user_contact(alert['user_id'])
+        try:
+            delivered = user is not None and sender.send(user, alert['message'])
+        except Exception:
+            logger.exception("Could not send alert %s", alert['id'])
+            status = 'failed' if alert['attempts'] + 1 >= MAX_ATTEMPTS else 'pending'
+            conn.execute('UPDATE alert_outbox SET attempts = attempts + 1, status = ? WHERE id = ?',
+                         (status, alert['id']))
+        else:
+            conn.execute('''
+                UPDATE alert_outbox SET attempts = attempts + 1, status = ?, sent_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', ('sent' if delivered else 'skipped', alert['id']))
+            sent += bool(delivered)
+        conn.commit()
+    conn.close()
+    return sent
+
+def dispatch():
+    """Send pending alerts from every shard in parallel and return how many were sent"""
+    return sum(sharding.map_shards(dispatch_shard))
+
+_dispatcher_thread = None
+_dispatcher_lock = threading.Lock()
+
+def run_dispatcher(interval=5.0, stop=None):
+    """Dispatch pending alerts every `interval` seconds until stop is set"""
+    stop = stop or threading.Event()
+    while not stop.wait(interval):
+        try:
+            dispatch()
+        except Exception:
+            logger.exception("Alert dispatch failed")
+
+def start_dispatcher():
+    """Start the dispatcher in a daemon thread, once per process"""
+    global _dispatcher_thread
+    with _dispatcher_lock:
+        if _dispatcher_thread is None:
+            _dispatcher_thread = threading.Thread(target=run_dispatcher, name='alert-dispatcher', daemon=True)
+            _dispatcher_thread.start()
+    return _dispatcher_thread
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(f"Sent {dispatch()} alerts")
@@ -0,0 +1,171 @@
+"""Aggregate statistics across all users for operators.
+
+Usage: python analytics.py [--month YYYY-MM] [--chunk-users N] [--workers N]
+
+Work is split into (shard, user id range) tasks. Each task pushes its
+aggregation down to SQLite and returns a small partial result: counters
+keyed by bucket type id, category id or adherence bin, never per-user
+rows. The partials are merged as workers finish, so memory stays flat
+however many users there are, and ids are decoded to names only at the
+end. Budget adherence percentiles come from a histogram with one bin per
+percent of budget used.
+"""
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+import pandas as pd
+import currency
+import sharding
+
+ACTIVE_DAYS = 30
+# Adherence above this percentage of budget lands in the last bin
+ADHERENCE_CAP = 300
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+def get_max_user_id():
+    conn = sharding.connect_directory()
+    max_id = conn.execute('SELECT MAX(id) FROM users').fetchone()[0]
+    conn.close()
+    return max_id or 0
+
+def empty_partial():
+    return {
+        'active_users': 0,
+        'buckets': Counter(),
+        'assets': Counter(),
+        'spend': Counter(),
+        'adherence': Counter(),
+    }
+
+def scan_range(task):
+    """Aggregate one shard's users with ids in [low, high) and return the partial result"""
+    shard, low, high, month, active_since, spend_since = task
+    partial = empty_partial()
+    conn = sharding.connect_shard(shard)
+    try:
+        # Each query is a range on an index leading with user_id
+        partial['active_users'] = conn.execute('''
+            SELECT COUNT(DISTINCT user_id) FROM expenses
+            WHERE user_id >= ? AND user_id < ? AND date >= ?
+        ''', (low, high, active_since)).fetchone()[0]
+        for row in conn.execute('''
+            SELECT type_id, currency, SUM(amount), COUNT(*) FROM buckets
+            WHERE user_id >= ? AND user_id < ?
+            GROUP BY type_id, currency
+        ''', (low, high)):
+            partial['assets'][row[0], row[1]] += row[2]
+            partial['buckets'][row[0]] += row[3]
+        for row in conn.execute('''
+            SELECT category_id, SUM(amount) FROM expense_totals
+            WHERE user_id >= ? AND user_id < ? AND month >= ? AND month <= ?
+            GROUP BY category_id
+        ''', (low, high, spend_since, month)):
+            partial['spend'][row[0]] += row[1]
+        for row in conn.execute('''
+            SELECT MIN(CAST(100 * COALESCE(t.amount, 0) / b.amount AS INTEGER), ?) AS used, COUNT(*)
+            FROM budget b
+            LEFT JOIN expense_totals t
+                ON t.user_id = b.user_id AND t.month = ? AND t.category_id = b.category_id
+            WHERE b.user_id >= ? AND b.user_id < ? AND b.amount > 0
+            GROUP BY used
+        ''', (ADHERENCE_CAP, month, low, high)):
+            partial['adherence'][row[0]] += row[1]
+    finally:
+        conn.close()
+    return partial
+
+def merge(total, partial):
+    """Fold a partial result into a running total"""
+    total['active_users'] += partial['active_users']
+    for key in ('buckets', 'assets', 'spend', 'adherence'):
+        total[key].update(partial[key])
+    return total
+
+def histogram_percentiles(histogram, percentiles=PERCENTILES):
+    """Read percentiles off a {value: count} histogram"""
+    count = sum(histogram.values())
+    if not count:
+        return {p: None for p in percentiles}
+    values = sorted(histogram)
+    result, seen, i = {}, 0, 0
+    for p in sorted(percentiles):
+        rank = p / 100 * count
+        while seen + histogram[values[i]] < rank:
+            seen += histogram[values[i]]
+            i += 1
+        result[p] = values[i]
+    return result
+
+def iter_tasks(month, chunk_users):
+    """Split every shard into tasks covering chunk_users ids each"""
+    today = date.today()
+    active_since = (today - timedelta(days=ACTIVE_DAYS)).isoformat()
+    spend_since = (pd.Period(month, freq='M') - 11).strftime('%Y-%m')
+    max_id = get_max_user_id()
+    for low in range(0, max_id + 1, chunk_users):
+        for shard in range(sharding.SHARD_COUNT):
+            yield shard, low, low + chunk_users, month, active_since, spend_since
+
+def collect(month=None, chunk_users=10000, workers=None):
+    """Compute operator statistics for a month, by default the current one
+
+    With workers=1 the tasks run in this process, which the in-memory
+    storage backend needs since its databases are not shared across
+    processes.
+    """
+    month = month or date.today().strftime('%Y-%m')
+    total = empty_partial()
+    tasks = iter_tasks(month, chunk_users)
+    if workers == 1:
+        for task in tasks:
+            merge(total, scan_range(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(scan_range, tasks, chunksize=4):
+                merge(total, partial)
+
+    # Label ids are the same on every shard; the directory holds them all
+    conn = sharding.connect_directory()
+    user_count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    types = dict(conn.execute('SELECT id, name FROM bucket_types').fetchall())
+    categories = dict(conn.execute('SELECT id, name FROM expense_categories').fetchall())
+    conn.close()
+
+    assets = Counter()
+    for (type_id, bucket_currency), amount in total['assets'].items():
+        assets[types[type_id]] += currency.to_base([amount], [bucket_currency]).fillna(0).iloc[0]
+    return {
+        'month': month,
+        'users': user_count,
+        'active_users': total['active_users'],
+        'buckets': {types[type_id]: count for type_id, count in total['buckets'].items()},
+        'assets': {bucket_type: round(float(amount), 2) for bucket_type, amount in assets.items()},
+        'spend_last_12_months': {categories[category_id]: round(amount, 2)
+                                 for category_id, amount in total['spend'].items()},
+        'budgets_tracked': sum(total['adherence'].values()),
+        'adherence_percentiles': histogram_percentiles(total['adherence']),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--month', help="month for budget adherence, default the current one")
+    parser.add_argument('--chunk-users', type=int, default=10000, help="user ids per task")
+    parser.add_argument('--workers', type=int, help="worker processes, default one per CPU")
+    args = parser.parse_args()
+
+    stats = collect(args.month, args.chunk_users, args.workers)
+    print(f"Users: {stats['users']}  active in the last {ACTIVE_DAYS} days: {stats['active_users']}")
+    print(f"\nAssets by bucket type ({currency.BASE_CURRENCY}):")
+    for bucket_type, amount in sorted(stats['assets'].items(), key=lambda item: -item[1]):
+        print(f"  {bucket_type:<20} {amount:>16,.2f}  ({stats['buckets'][bucket_type]} buckets)")
+    print("\nSpend by category, last 12 months:")
+    for category, amount in sorted(stats['spend_last_12_months'].items(), key=lambda item: -item[1]):
+        print(f"  {category:<28} {amount:>16,.2f}")
+    print(f"\nBudget used in {stats['month']} across {stats['budgets_tracked']} budgets:")
+    for p, used in stats['adherence_percentiles'].items():
+        label = f">={ADHERENCE_CAP}" if used == ADHERENCE_CAP else str(used)
+        print(f"  p{p:<3} {label}%")
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,15 @@
 import streamlit as st
+import overview
 import buckets
 import expenses
 import auth
 import financial_health
 import tips
 import goals
+import dedup
+import archive
+import alerts
+import session_data
 
 st.set_page_config(
     page_title="Personal Finance Manager",
@@ -13,6 +18,13 @@ st.set_page_config(
 )
 
 def main():
+    # Fingerprint and flag duplicate expenses left by earlier versions
+    dedup.start_background_scan()
+    # Move expenses past the archive horizon out of the live table
+    archive.start_background_archive()
+    # Deliver budget alerts queued by the expense write paths
+    alerts.start_dispatcher()
+
     # Initialize session state
     auth.init_session_state()
 
@@ -24,16 +36,24 @@ def main():
         # Show logout button in sidebar
         auth.show_logout_button()
 
+        # Load the data the other pages read while the overview is shown
+        user_id = st.session_state.user['id']
+        if st.session_state.get('prefetched_user') != user_id:
+            st.session_state.prefetched_user = user_id
+            session_data.start_prefetch(user_id)
+
         # Navigation
         page = st.sidebar.radio(
             "Navigate to",
-            ["Money Buckets", "Monthly Expenses", "Financial Goals", "Financial Health Score"]
+            ["Overview", "Money Buckets", "Monthly Expenses", "Financial Goals", "Financial Health Score"]
         )
 
         # Show contextual tip at the top of the sidebar
         tips.show_tip_widget(tips.get_context_from_page(page))
 
-        if page == "Money Buckets":
+        if page == "Overview":
+            overview.show_overview_page()
+        elif page == "Money Buckets":
             buckets.show_buckets_page()
         elif page == "Monthly Expenses":
             expenses.show_expenses_page()
@@ -0,0 +1,79 @@
+"""Move expenses older than the archive horizon out of the live table, one user at a time.
+
+Usage: python archive.py [MONTHS]
+
+MONTHS defaults to FINANCE_ARCHIVE_MONTHS, or 24. Expenses dated before
+the first day of the month that many months back are moved into
+expenses_archive and totalled into expense_rollups.
+"""
+import os
+import sys
+import threading
+from datetime import date
+import pandas as pd
+import database as db
+import sharding
+
+ARCHIVE_MONTHS = int(os.environ.get('FINANCE_ARCHIVE_MONTHS', 24))
+ARCHIVED_COLUMNS = 'id, user_id, category_id, amount, date, description, fingerprint, duplicate_of'
+
+def archive_cutoff(months=ARCHIVE_MONTHS, today=None):
+    """Get the first day of the oldest month kept in the live table"""
+    return (pd.Period(today or date.today(), freq='M') - months).start_time.strftime('%Y-%m-%d')
+
+def archive_user(conn, user_id, cutoff):
+    """Move one user's expenses dated before cutoff into the archive and return how many moved"""
+    # Every statement walks the (user_id, date) index, and the whole move is
+    # one transaction so readers see the expenses in exactly one tier
+    with conn:
+        conn.execute('''
+            INSERT INTO expense_rollups (user_id, month, category_id, amount, count)
+            SELECT user_id, strftime('%Y-%m', date), category_id, SUM(amount), COUNT(*)
+            FROM expenses WHERE user_id = ? AND date < ?
+            GROUP BY strftime('%Y-%m', date), category_id
+            ON CONFLICT (user_id, month, category_id) DO UPDATE SET
+                amount = amount + excluded.amount, count = count + excluded.count
+        ''', (user_id, cutoff))
+        conn.execute(f'''
+            INSERT INTO expenses_archive ({ARCHIVED_COLUMNS})
+            SELECT {ARCHIVED_COLUMNS} FROM expenses WHERE user_id = ? AND date < ?
+        ''', (user_id, cutoff))
+        moved = conn.execute('DELETE FROM expenses WHERE user_id = ? AND date < ?',
+                             (user_id, cutoff)).rowcount
+        if moved:
+            conn.execute('''
+                INSERT INTO expense_archive_bounds (user_id, archived_before) VALUES (?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    archived_before = MAX(archived_before, excluded.archived_before)
+            ''', (user_id, cutoff))
+    return moved
+
+def archive_shard(shard, cutoff):
+    """Archive the old expenses of every user on one shard and return how many moved"""
+    moved = 0
+    for user_id in db.get_user_ids(shard):
+        conn = sharding.connect_shard(shard)
+        moved += archive_user(conn, user_id, cutoff)
+        conn.close()
+    return moved
+
+def archive(months=ARCHIVE_MONTHS):
+    """Archive every shard in parallel and return how many expenses moved"""
+    cutoff = archive_cutoff(months)
+    return sum(sharding.map_shards(lambda shard: archive_shard(shard, cutoff)))
+
+_archive_thread = None
+_archive_lock = threading.Lock()
+
+def start_background_archive():
+    """Start archiving in a daemon thread, once per process"""
+    global _archive_thread
+    with _archive_lock:
+        if _archive_thread is None:
+            _archive_thread = threading.Thread(target=archive, name='expense-archive', daemon=True)
+            _archive_thread.start()
+    return _archive_thread
+
+if __name__ == '__main__':
+    months = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_MONTHS
+    print(f"Archived {archive(months)} expenses dated before {archive_cutoff(months)}")
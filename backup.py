@@ -0,0 +1,137 @@
+"""Back up the databases while the app is running, or export one user's data.
+
+Usage:
+    python backup.py backup DEST_DIR
+    python backup.py export USER_ID DEST_DIR [--format csv|jsonl]
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+import database as db
+import sharding
+
+# Tables exported for a user, with the query selecting that user's rows;
+# label ids are exported along with the label names
+EXPORT_QUERIES = {
+    'buckets': '''
+        SELECT b.*, l.name AS type FROM buckets b
+        JOIN bucket_types l ON l.id = b.type_id
+        WHERE b.user_id = ?
+    ''',
+    'expenses': '''
+        SELECT e.*, l.name AS category FROM expenses e
+        JOIN expense_categories l ON l.id = e.category_id
+        WHERE e.user_id = ?
+    ''',
+    'expenses_archive': '''
+        SELECT e.*, l.name AS category FROM expenses_archive e
+        JOIN expense_categories l ON l.id = e.category_id
+        WHERE e.user_id = ?
+    ''',
+    'expense_rollups': '''
+        SELECT r.*, l.name AS category FROM expense_rollups r
+        JOIN expense_categories l ON l.id = r.category_id
+        WHERE r.user_id = ?
+    ''',
+    'budget': '''
+        SELECT b.*, l.name AS category FROM budget b
+        JOIN expense_categories l ON l.id = b.category_id
+        WHERE b.user_id = ?
+    ''',
+    'goals': '''
+        SELECT g.*, l.name AS category FROM goals g
+        JOIN goal_categories l ON l.id = g.category_id
+        WHERE g.user_id = ?
+    ''',
+    'goal_buckets': '''
+        SELECT gb.* FROM goal_buckets gb
+        JOIN goals g ON g.id = gb.goal_id
+        WHERE g.user_id = ?
+    ''',
+}
+
+def backup_database(src_path, dest_path, pages=256, sleep=0.005):
+    """Copy a live database with SQLite's online backup API
+
+    Copies `pages` pages per step and sleeps between steps, so sessions can
+    keep reading and writing while the backup runs.
+    """
+    src = sharding.connect_path(src_path)
+    dest = sqlite3.connect(dest_path)
+    try:
+        src.backup(dest, pages=pages, sleep=sleep)
+    finally:
+        dest.close()
+        src.close()
+
+def backup_all(dest_dir, pages=256):
+    """Back up the user directory and every shard into dest_dir and return the written paths"""
+    os.makedirs(dest_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    written = []
+    for path in sharding.all_paths():
+        stem, ext = os.path.splitext(os.path.basename(path))
+        dest_path = os.path.join(dest_dir, f"{stem}-{stamp}{ext}")
+        backup_database(path, dest_path, pages)
+        written.append(dest_path)
+    return written
+
+def iter_user_rows(user_id, table, chunk_size=1000):
+    """Yield the column names of a user's table, then its rows chunk by chunk"""
+    conn = db.get_db_connection(user_id)
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(EXPORT_QUERIES[table], (user_id,))
+        yield [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+def export_user(user_id, dest_dir, fmt='csv', chunk_size=1000):
+    """Write one file per table with a user's data and return the written paths"""
+    os.makedirs(dest_dir, exist_ok=True)
+    written = []
+    for table in EXPORT_QUERIES:
+        dest_path = os.path.join(dest_dir, f"{table}.{fmt}")
+        rows = iter_user_rows(user_id, table, chunk_size)
+        columns = next(rows)
+        with open(dest_path, 'w', newline='', encoding='utf-8') as f:
+            if fmt == 'csv':
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    f.write(json.dumps(dict(zip(columns, row))) + '\n')
+        written.append(dest_path)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    backup_parser = subparsers.add_parser('backup')
+    backup_parser.add_argument('dest_dir')
+    backup_parser.add_argument('--pages', type=int, default=256)
+    export_parser = subparsers.add_parser('export')
+    export_parser.add_argument('user_id', type=int)
+    export_parser.add_argument('dest_dir')
+    export_parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    args = parser.parse_args()
+
+    if args.command == 'backup':
+        written = backup_all(args.dest_dir, args.pages)
+    else:
+        written = export_user(args.user_id, args.dest_dir, args.format)
+    for path in written:
+        print(path)
+
+if __name__ == '__main__':
+    main()
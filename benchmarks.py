@@ -0,0 +1,89 @@
+"""Time the database operations against each storage backend.
+
+Usage: python benchmarks.py [--backends libsql memory sqlite] [--users 20] [--expenses 500]
+
+Backends whose driver isn't installed are skipped.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+import sharding
+import storage
+
+def timed(results, name, func, *args):
+    start = time.perf_counter()
+    value = func(*args)
+    results.setdefault(name, []).append(time.perf_counter() - start)
+    return value
+
+def create_users(count):
+    import database as db
+    conn = db.get_db_connection()
+    user_ids = []
+    for i in range(count):
+        cursor = conn.execute(
+            'INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)',
+            (f"bench{i}", '', f"bench{i}@example.com")
+        )
+        user_ids.append(cursor.lastrowid)
+    conn.commit()
+    conn.close()
+    return user_ids
+
+def run_suite(user_count, expense_count):
+    """Run the benchmark suite against the active backend and return timings per operation"""
+    import database as db
+    results = {}
+    start_date = date.today() - timedelta(days=365)
+    for user_id in create_users(user_count):
+        for bucket_type in ["RRSP", "TFSA", "Cash", "Crypto"]:
+            timed(results, 'add_bucket', db.add_bucket, user_id, bucket_type, 1000.0, bucket_type)
+        for i in range(expense_count):
+            timed(results, 'add_expense', db.add_expense, user_id, "Food", 12.5,
+                  start_date + timedelta(days=i % 365), f"expense {i}")
+        timed(results, 'set_budget', db.set_budget, user_id, "Food", 400.0)
+        goal_id = timed(results, 'add_goal', db.add_goal, user_id, "Goal", 5000.0,
+                        start_date + timedelta(days=730), "Savings")
+        buckets_df = timed(results, 'get_buckets', db.get_buckets, user_id)
+        timed(results, 'link_goal_to_buckets', db.link_goal_to_buckets,
+              goal_id, buckets_df['id'].tolist(), user_id)
+        timed(results, 'update_bucket', db.update_bucket, int(buckets_df['id'].iloc[0]), 1500.0, user_id)
+        timed(results, 'get_expenses', db.get_expenses, user_id)
+        timed(results, 'get_expenses_month', db.get_expenses, user_id, start_date.strftime("%Y-%m"))
+        timed(results, 'get_budget', db.get_budget, user_id)
+        timed(results, 'get_goals', db.get_goals, user_id)
+        timed(results, 'calculate_goal_current_amount', db.calculate_goal_current_amount, goal_id, user_id)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=sorted(storage.BACKENDS))
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--expenses', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Importing database.py runs init_db(), so point it at a scratch
+        # database first; never benchmark against the real finance.db
+        sharding.DB_PATH = os.path.join(tmpdir, 'bench.db')
+        import database as db
+        for name in args.backends:
+            try:
+                storage.use_backend(name)
+            except ImportError as e:
+                print(f"\n{name}\n  skipped: {e}")
+                continue
+            # File-based backends each get their own files
+            sharding.DB_PATH = os.path.join(tmpdir, f'bench-{name}.db')
+            db.init_db()
+            results = run_suite(args.users, args.expenses)
+            print(f"\n{name}")
+            for op, timings in results.items():
+                mean_ms = sum(timings) / len(timings) * 1000
+                print(f"  {op:32} {len(timings):7} calls  {mean_ms:8.3f} ms/call")
+        storage.use_backend('sqlite')
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,41 @@
 import streamlit as st
 import plotly.express as px
 import database as db
+from utils import rerun_fragment
+import session_data
+import currency
 import pandas as pd
 
+@st.fragment
+def show_bucket_editor():
+    """Show editable bucket amounts; an edit reruns only this section"""
+    st.subheader("Your Buckets")
+    data = session_data.get_user_data()
+    for idx, row in data.buckets_frame().iterrows():
+        col1, col2, col3, col4 = st.columns([2, 1, 2, 1])
+        with col1:
+            st.write(row['name'])
+        with col2:
+            st.write(row['type'])
+        with col3:
+            new_amount = st.number_input(
+                "Amount",
+                value=float(row['amount']),
+                key=f"bucket_{row['id']}",
+                format="%.2f"
+            )
+            if new_amount != row['amount']:
+                data.update_bucket(row['id'], new_amount)
+                rerun_fragment()
+        with col4:
+            st.write(f"${row['amount']:,.2f} {row['currency']}")
+
 def show_buckets_page():
     st.header("Money Buckets")
-    user_id = st.session_state.user['id']
 
     # Get buckets data first
-    buckets_df = db.get_buckets(user_id)
+    data = session_data.get_user_data()
+    buckets_df = data.buckets_frame()
 
     # Add new bucket (in an expander)
     with st.expander("➕ Add New Bucket", expanded=False):
@@ -17,20 +44,27 @@ def show_buckets_page():
             bucket_name = st.text_input("Bucket Name")
             bucket_type = st.selectbox(
                 "Bucket Type",
-                ["RRSP", "TFSA", "Cash", "Crypto", "Non-Registered"]
+                db.BUCKET_TYPES
             )
+            bucket_currency = st.selectbox("Currency", currency.get_currencies())
             amount = st.number_input("Amount", min_value=0.0, format="%.2f")
             submitted = st.form_submit_button("Add Bucket")
 
             if submitted and bucket_name:
-                db.add_bucket(user_id, bucket_name, amount, bucket_type)
+                data.add_bucket(bucket_name, amount, bucket_type, bucket_currency)
                 st.success(f"Added {bucket_name} bucket!")
                 st.rerun()
 
     if not buckets_df.empty:
+        # Totals and distributions are in the base currency
+        missing = currency.missing_rates(buckets_df['currency'])
+        if missing:
+            st.warning(f"No exchange rate for {', '.join(missing)}; those buckets are left out of the totals.")
+        converted_df = currency.convert_frame(buckets_df)
+
         # Show distribution chart first
         st.subheader("Money Distribution by Type")
-        type_distribution = buckets_df.groupby('type')['amount'].sum().reset_index()
+        type_distribution = converted_df.groupby('type', observed=True)['amount'].sum().reset_index()
         fig = px.pie(
             type_distribution,
             values='amount',
@@ -40,8 +74,8 @@ def show_buckets_page():
         st.plotly_chart(fig)
 
         # Summary statistics
-        total_money = buckets_df['amount'].sum()
-        st.metric("Total Money", f"${total_money:,.2f}")
+        total_money = converted_df['amount'].sum()
+        st.metric(f"Total Money ({currency.BASE_CURRENCY})", f"${total_money:,.2f}")
 
         # Show percentages by type
         st.write("Percentage Distribution by Type:")
@@ -49,25 +83,22 @@ def show_buckets_page():
         for type_name, pct in zip(type_distribution['type'], type_percentages):
             st.write(f"{type_name}: {pct}%")
 
+        # Value of the current holdings over time, at the rates in effect each month
+        if (buckets_df['currency'] != currency.BASE_CURRENCY).any():
+            history, _ = currency.get_rates()
+            months = pd.DataFrame({'date': history['date'].drop_duplicates()})
+            holdings = months.merge(buckets_df[['currency', 'amount']], how='cross')
+            holdings['value'] = currency.to_base_asof(holdings)
+            value_history = holdings.groupby('date')['value'].sum().reset_index()
+            fig = px.line(
+                value_history,
+                x='date',
+                y='value',
+                title=f'Value of Current Holdings in {currency.BASE_CURRENCY} at Historical Rates'
+            )
+            st.plotly_chart(fig)
+
         # Show buckets table
-        st.subheader("Your Buckets")
-        for idx, row in buckets_df.iterrows():
-            col1, col2, col3, col4 = st.columns([2, 1, 2, 1])
-            with col1:
-                st.write(row['name'])
-            with col2:
-                st.write(row['type'])
-            with col3:
-                new_amount = st.number_input(
-                    "Amount",
-                    value=float(row['amount']),
-                    key=f"bucket_{row['id']}",
-                    format="%.2f"
-                )
-                if new_amount != row['amount']:
-                    db.update_bucket(row['id'], new_amount, user_id)
-                    st.rerun()
-            with col4:
-                st.write(f"${row['amount']:,.2f}")
+        show_bucket_editor()
     else:
         st.info("No buckets created yet. Click '➕ Add New Bucket' above to create your first bucket!")
\ No newline at end of file
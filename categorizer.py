@@ -0,0 +1,154 @@
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+import numpy as np
+import database as db
+
+TOKEN_PATTERN = re.compile(r'[a-z][a-z0-9&]+')
+
+def tokenize(description):
+    """Split a description into lowercase word tokens"""
+    return TOKEN_PATTERN.findall(description.lower()) if description else []
+
+class CategoryModel:
+    """Naive Bayes model from description tokens to expense categories"""
+
+    def __init__(self):
+        self.token_counts = defaultdict(Counter)
+        self.category_counts = Counter()
+        self._scorer = None
+
+    def add(self, token, category, count=1):
+        self.token_counts[token][category] += count
+        self.category_counts[category] += count
+        self._scorer = None
+
+    def learn(self, category, description):
+        """Count a description's tokens towards a category and return the (token, category, count) rows"""
+        rows = [(token, category, count) for token, count in Counter(tokenize(description)).items()]
+        for token, _, count in rows:
+            self.add(token, category, count)
+        return rows
+
+    def scorer(self):
+        """Get a scorer for the model as it is now, building one after any change"""
+        if self._scorer is None:
+            self._scorer = CategoryScorer(self)
+        return self._scorer
+
+class CategoryScorer:
+    """Log probabilities computed from a model at one point in time
+
+    A scorer never changes once built, so it can classify while another
+    session teaches the model.
+    """
+
+    def __init__(self, model):
+        # One row of log P(token | category) per token, Laplace smoothed
+        self.categories = sorted(model.category_counts)
+        self.token_index = {token: i for i, token in enumerate(model.token_counts)}
+        column = {category: j for j, category in enumerate(self.categories)}
+        counts = np.zeros((len(self.token_index), len(self.categories)), dtype=np.float32)
+        for token, i in self.token_index.items():
+            for category, count in model.token_counts[token].items():
+                counts[i, column[category]] = count
+        totals = np.array([model.category_counts[c] for c in self.categories], dtype=np.float32)
+        self.matrix = np.log((counts + 1) / (totals + len(self.token_index)))
+        self.prior = np.log(totals / totals.sum()) if self.categories else totals
+
+    def classify(self, descriptions):
+        """Predict a category for each description, or None when no token is known"""
+        # Imported statements repeat descriptions, so score each distinct one once
+        unique = list(dict.fromkeys(descriptions))
+        token_ids, offsets, scored = [], [], []
+        lookup = self.token_index.get
+        for description in unique:
+            ids = [i for i in map(lookup, tokenize(description)) if i is not None]
+            if ids:
+                offsets.append(len(token_ids))
+                token_ids.extend(ids)
+                scored.append(description)
+
+        predictions = dict.fromkeys(unique)
+        if scored:
+            scores = np.add.reduceat(self.matrix[token_ids], offsets, axis=0) + self.prior
+            for description, best in zip(scored, scores.argmax(axis=1)):
+                predictions[description] = self.categories[best]
+        return [predictions[description] for description in descriptions]
+
+def merge_rows(rows):
+    """Sum (token, category, count) rows sharing a token and category"""
+    totals = Counter()
+    for token, category, count in rows:
+        totals[token, category] += count
+    return [(token, category, count) for (token, category), count in totals.items()]
+
+# Models of the most recently used MAX_MODELS users are kept in memory;
+# an evicted model is loaded back from its stored token counts
+MAX_MODELS = int(os.environ.get('FINANCE_MAX_MODELS', 1000))
+
+_models = OrderedDict()
+_models_lock = threading.Lock()
+# user_id -> lock held while that user's model is loaded or trained
+_loading = {}
+
+def load_model(user_id):
+    """Load a user's model from the database, training it from their expenses the first time"""
+    model = CategoryModel()
+    token_rows = db.get_category_tokens(user_id)
+    if token_rows:
+        for token, category, count in token_rows:
+            model.add(token, category, count)
+    else:
+        new_rows = []
+        for category, description in db.iter_expense_descriptions(user_id):
+            new_rows.extend(model.learn(category, description))
+        if new_rows:
+            db.add_category_tokens(user_id, merge_rows(new_rows))
+    return model
+
+def get_model(user_id):
+    """Get a user's model, loading it from the database or training it from their expenses"""
+    with _models_lock:
+        if user_id in _models:
+            _models.move_to_end(user_id)
+            return _models[user_id]
+        loading = _loading.setdefault(user_id, threading.Lock())
+
+    # Loading holds only this user's lock, so other users aren't kept
+    # waiting; a second caller for the same user waits and then finds it
+    with loading:
+        with _models_lock:
+            if user_id in _models:
+                return _models[user_id]
+        model = load_model(user_id)
+        with _models_lock:
+            _models[user_id] = model
+            while len(_models) > MAX_MODELS:
+                _models.popitem(last=False)
+            _loading.pop(user_id, None)
+    return model
+
+def classify(user_id, descriptions):
+    """Predict categories for a batch of descriptions"""
+    model = get_model(user_id)
+    # learn_many changes the model under the lock, so take the scorer under
+    # it too; scoring itself runs outside on the unchanging scorer
+    with _models_lock:
+        scorer = model.scorer()
+    return scorer.classify(descriptions)
+
+def learn(user_id, category, description):
+    """Update a user's model with a categorized expense"""
+    learn_many(user_id, [(category, description)])
+
+def learn_many(user_id, expenses):
+    """Update a user's model with (category, description) pairs"""
+    model = get_model(user_id)
+    with _models_lock:
+        new_rows = []
+        for category, description in expenses:
+            new_rows.extend(model.learn(category, description))
+    if new_rows:
+        db.add_category_tokens(user_id, merge_rows(new_rows))
@@ -0,0 +1,76 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+BASE_CURRENCY = 'CAD'
+RATES_PATH = os.environ.get(
+    'FINANCE_RATES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rates.csv')
+)
+
+def load_rates(path):
+    """Read a rates file of (date, currency, rate) rows, rate being units of BASE_CURRENCY per unit"""
+    rates = pd.read_csv(path, comment='#', dtype={'currency': str, 'rate': 'float64'})
+    rates['date'] = pd.to_datetime(rates['date'], format='ISO8601')
+    return rates.sort_values('date', ignore_index=True)
+
+_rates = {}
+_rates_lock = threading.Lock()
+
+def get_rates():
+    """Get the historical rates and the latest rate per currency, reloading only when the file changes"""
+    try:
+        mtime = os.path.getmtime(RATES_PATH)
+    except OSError:
+        mtime = None
+    with _rates_lock:
+        if _rates.get('mtime') != mtime or 'history' not in _rates:
+            if mtime is None:
+                history = pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'),
+                                        'currency': pd.Series(dtype=str),
+                                        'rate': pd.Series(dtype='float64')})
+            else:
+                history = load_rates(RATES_PATH)
+            latest = history.groupby('currency')['rate'].last()
+            latest[BASE_CURRENCY] = 1.0
+            _rates.update(mtime=mtime, history=history, latest=latest)
+        return _rates['history'], _rates['latest']
+
+def get_currencies():
+    """Get the currencies a bucket can be held in, base currency first"""
+    _, latest = get_rates()
+    return [BASE_CURRENCY] + sorted(c for c in latest.index if c != BASE_CURRENCY)
+
+def to_base(amounts, currencies):
+    """Convert amounts to BASE_CURRENCY at the latest rates in one vectorized step
+
+    Amounts in a currency without a rate come back as NaN, which pandas sums skip.
+    """
+    _, latest = get_rates()
+    rates = pd.Series(currencies, dtype=object).map(latest).to_numpy(dtype='float64')
+    index = amounts.index if isinstance(amounts, pd.Series) else None
+    return pd.Series(np.asarray(amounts, dtype='float64') * rates, index=index)
+
+def convert_frame(df):
+    """Return a copy of a bucket frame with its amounts in BASE_CURRENCY"""
+    converted = df.copy()
+    converted['amount'] = to_base(df['amount'], df['currency'])
+    return converted
+
+def missing_rates(currencies):
+    """Get the currencies among those given that have no rate"""
+    _, latest = get_rates()
+    return sorted(set(currencies) - set(latest.index))
+
+def to_base_asof(df, date_column='date'):
+    """Convert amounts to BASE_CURRENCY at the rate in effect on each row's date"""
+    history, _ = get_rates()
+    left = df[[date_column, 'currency', 'amount']].astype({'currency': str})
+    left['row'] = np.arange(len(left))
+    merged = pd.merge_asof(
+        left.sort_values(date_column),
+        history.rename(columns={'date': date_column}).astype({date_column: left[date_column].dtype}),
+        on=date_column, by='currency', direction='backward'
+    ).sort_values('row')
+    rates = merged['rate'].where(merged['currency'] != BASE_CURRENCY, 1.0)
+    return pd.Series(merged['amount'].to_numpy() * rates.to_numpy(), index=df.index)
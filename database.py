@@ -1,20 +1,61 @@
 import sqlite3
+import threading
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import hashlib
+import re
+import passwords
+import sharding
 
-def get_db_connection():
-    conn = sqlite3.connect('finance.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+def get_db_connection(user_id=None):
+    """Connect to the shard holding a user's data, or to the user directory"""
+    if user_id is None:
+        return sharding.connect_directory()
+    return sharding.connect_shard(sharding.shard_for_user(user_id))
 
 def init_db():
-    conn = get_db_connection()
+    """Create or migrate the schema in the user directory and every shard"""
+    for path in sharding.all_paths():
+        conn = sharding.connect_path(path)
+        create_schema(conn, directory=path == sharding.DB_PATH)
+        conn.close()
+
+# Labels repeated across the fact tables (expense and budget categories,
+# goal categories, bucket types) are stored once in a lookup table and
+# referenced by integer id. Ids are given out by the user directory and
+# copied to every shard, so an id names the same label on every shard.
+# The lists below are seeded in order on a new install; only append to them.
+EXPENSE_CATEGORIES = ["Housing", "Utilities", "Transportation", "Food", "Restaurants", "Insurance",
+                      "Entertainment", "Shopping & Personal Care", "Household Supplies", "Vacations",
+                      "Hobby", "Miscellaneous"]
+GOAL_CATEGORIES = ["Savings", "Investment", "Emergency Fund", "Retirement", "Major Purchase", "Other"]
+BUCKET_TYPES = ["RRSP", "TFSA", "Cash", "Crypto", "Non-Registered"]
+LABEL_TABLES = {
+    'expense_categories': EXPENSE_CATEGORIES,
+    'goal_categories': GOAL_CATEGORIES,
+    'bucket_types': BUCKET_TYPES,
+}
+# No other labels are ever stored; labels outside the lists found while
+# migrating tables from older installs are filed under these instead
+LABEL_FALLBACKS = {
+    'expense_categories': "Miscellaneous",
+    'goal_categories': "Other",
+    'bucket_types': "Non-Registered",
+}
+
+def create_schema(conn, directory=True):
+    """Create or migrate the schema in one database
+
+    directory tells whether conn is the user directory, which gives out
+    label ids; other databases copy them from it.
+    """
     c = conn.cursor()
 
+    # WAL lets readers proceed while a session holds the write lock
+    c.execute('PRAGMA journal_mode=WAL')
+    repair_legacy_references(c)
+
     # Create users table
     c.execute('''
         CREATE TABLE IF NOT EXISTS users
@@ -22,45 +63,81 @@ def init_db():
          username TEXT UNIQUE NOT NULL,
          password_hash TEXT NOT NULL,
          email TEXT UNIQUE NOT NULL,
+         phone TEXT,
          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
     ''')
+    add_column_if_missing(c, 'users', 'phone', 'TEXT')
+    # SQLite can't add a UNIQUE column, so uniqueness comes from an index
+    add_column_if_missing(c, 'users', 'auth0_id', 'TEXT')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_auth0_id ON users (auth0_id)')
+
+    # Create the label lookup tables
+    for table, names in LABEL_TABLES.items():
+        c.execute(f'CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)')
+        if directory:
+            c.executemany(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', [(name,) for name in names])
+    if not directory:
+        sync_labels(c)
 
     # Create buckets table with user_id
+    legacy = rename_legacy_table(c, 'buckets', 'type')
     c.execute('''
         CREATE TABLE IF NOT EXISTS buckets
         (id INTEGER PRIMARY KEY AUTOINCREMENT,
          user_id INTEGER NOT NULL,
          name TEXT NOT NULL,
          amount REAL NOT NULL,
-         type TEXT NOT NULL,
+         type_id INTEGER NOT NULL,
+         currency TEXT NOT NULL DEFAULT 'CAD',
          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-         FOREIGN KEY (user_id) REFERENCES users (id))
+         FOREIGN KEY (user_id) REFERENCES users (id),
+         FOREIGN KEY (type_id) REFERENCES bucket_types (id))
     ''')
+    if legacy:
+        copy_legacy_rows(c, 'buckets', 'type', 'type_id', 'bucket_types')
+    add_column_if_missing(c, 'buckets', 'currency', "TEXT NOT NULL DEFAULT 'CAD'")
+    c.execute('CREATE INDEX IF NOT EXISTS idx_buckets_user ON buckets (user_id)')
 
     # Create expenses table with user_id
+    legacy = rename_legacy_table(c, 'expenses', 'category')
     c.execute('''
         CREATE TABLE IF NOT EXISTS expenses
         (id INTEGER PRIMARY KEY AUTOINCREMENT,
          user_id INTEGER NOT NULL,
-         category TEXT NOT NULL,
+         category_id INTEGER NOT NULL,
          amount REAL NOT NULL,
          date DATE NOT NULL,
          description TEXT,
-         FOREIGN KEY (user_id) REFERENCES users (id))
+         fingerprint TEXT,
+         duplicate_of INTEGER,
+         FOREIGN KEY (user_id) REFERENCES users (id),
+         FOREIGN KEY (category_id) REFERENCES expense_categories (id))
     ''')
+    if legacy:
+        copy_legacy_rows(c, 'expenses', 'category', 'category_id', 'expense_categories')
+    add_column_if_missing(c, 'expenses', 'fingerprint', 'TEXT')
+    add_column_if_missing(c, 'expenses', 'duplicate_of', 'INTEGER')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_expenses_fingerprint ON expenses (fingerprint)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date)')
 
     # Create budget table (removed DROP TABLE statement)
+    legacy = rename_legacy_table(c, 'budget', 'category')
     c.execute('''
         CREATE TABLE IF NOT EXISTS budget
         (id INTEGER PRIMARY KEY AUTOINCREMENT,
          user_id INTEGER NOT NULL,
-         category TEXT NOT NULL,
+         category_id INTEGER NOT NULL,
          amount REAL NOT NULL,
-         UNIQUE(user_id, category),
-         FOREIGN KEY (user_id) REFERENCES users (id))
+         UNIQUE(user_id, category_id),
+         FOREIGN KEY (user_id) REFERENCES users (id),
+         FOREIGN KEY (category_id) REFERENCES expense_categories (id))
     ''')
+    if legacy:
+        copy_legacy_rows(c, 'budget', 'category', 'category_id', 'expense_categories',
+                         'ON CONFLICT (user_id, category_id) DO UPDATE SET amount = amount + excluded.amount')
 
     # Create goals table (without current_amount)
+    legacy = rename_legacy_table(c, 'goals', 'category')
     c.execute('''
         CREATE TABLE IF NOT EXISTS goals
         (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -68,10 +145,13 @@ def init_db():
          name TEXT NOT NULL,
          target_amount REAL NOT NULL,
          deadline DATE NOT NULL,
-         category TEXT NOT NULL,
+         category_id INTEGER NOT NULL,
          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-         FOREIGN KEY (user_id) REFERENCES users (id))
+         FOREIGN KEY (user_id) REFERENCES users (id),
+         FOREIGN KEY (category_id) REFERENCES goal_categories (id))
     ''')
+    if legacy:
+        copy_legacy_rows(c, 'goals', 'category', 'category_id', 'goal_categories')
 
     # Create goal_buckets table for mapping goals to buckets
     c.execute('''
@@ -83,17 +163,430 @@ def init_db():
          FOREIGN KEY (bucket_id) REFERENCES buckets (id))
     ''')
 
+    # Full-text index over expense descriptions and category names, kept in
+    # sync with the expenses table by triggers. Its content is a view that
+    # decodes the category ids and gives each row an owner token ('u' and
+    # the user id), so searches match the user inside the index instead of
+    # filtering other users' matches afterwards. An index built before the
+    # view had the owner column is rebuilt.
+    fts_exists = drop_outdated_search_index(c, 'expenses')
+    c.execute('''
+        CREATE VIEW IF NOT EXISTS expenses_search AS
+        SELECT e.id, 'u' || e.user_id AS owner, e.description, l.name AS category
+        FROM expenses e JOIN expense_categories l ON l.id = e.category_id
+    ''')
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts
+        USING fts5(owner, description, category, content='expenses_search', content_rowid='id')
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO expenses_fts (rowid, owner, description, category)
+            VALUES (new.id, 'u' || new.user_id, new.description,
+                    (SELECT name FROM expense_categories WHERE id = new.category_id));
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, owner, description, category)
+            VALUES ('delete', old.id, 'u' || old.user_id, old.description,
+                    (SELECT name FROM expense_categories WHERE id = old.category_id));
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update
+        AFTER UPDATE OF user_id, description, category_id ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, owner, description, category)
+            VALUES ('delete', old.id, 'u' || old.user_id, old.description,
+                    (SELECT name FROM expense_categories WHERE id = old.category_id));
+            INSERT INTO expenses_fts (rowid, owner, description, category)
+            VALUES (new.id, 'u' || new.user_id, new.description,
+                    (SELECT name FROM expense_categories WHERE id = new.category_id));
+        END
+    ''')
+    if not fts_exists:
+        # Index expenses recorded before the search table existed
+        c.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+
+    # Create expenses_archive table holding expenses moved out of the live
+    # table by archive.py; ids are kept so duplicate_of links stay valid
+    legacy = rename_legacy_table(c, 'expenses_archive', 'category')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS expenses_archive
+        (id INTEGER PRIMARY KEY,
+         user_id INTEGER NOT NULL,
+         category_id INTEGER NOT NULL,
+         amount REAL NOT NULL,
+         date DATE NOT NULL,
+         description TEXT,
+         fingerprint TEXT,
+         duplicate_of INTEGER,
+         FOREIGN KEY (user_id) REFERENCES users (id),
+         FOREIGN KEY (category_id) REFERENCES expense_categories (id))
+    ''')
+    if legacy:
+        copy_legacy_rows(c, 'expenses_archive', 'category', 'category_id', 'expense_categories')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_expenses_archive_user_date ON expenses_archive (user_id, date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_expenses_archive_fingerprint ON expenses_archive (fingerprint)')
+    archive_fts_exists = drop_outdated_search_index(c, 'expenses_archive')
+    c.execute('''
+        CREATE VIEW IF NOT EXISTS expenses_archive_search AS
+        SELECT e.id, 'u' || e.user_id AS owner, e.description, l.name AS category
+        FROM expenses_archive e JOIN expense_categories l ON l.id = e.category_id
+    ''')
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_archive_fts
+        USING fts5(owner, description, category, content='expenses_archive_search', content_rowid='id')
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_archive_fts_insert AFTER INSERT ON expenses_archive BEGIN
+            INSERT INTO expenses_archive_fts (rowid, owner, description, category)
+            VALUES (new.id, 'u' || new.user_id, new.description,
+                    (SELECT name FROM expense_categories WHERE id = new.category_id));
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_archive_fts_delete AFTER DELETE ON expenses_archive BEGIN
+            INSERT INTO expenses_archive_fts (expenses_archive_fts, rowid, owner, description, category)
+            VALUES ('delete', old.id, 'u' || old.user_id, old.description,
+                    (SELECT name FROM expense_categories WHERE id = old.category_id));
+        END
+    ''')
+    if not archive_fts_exists:
+        c.execute("INSERT INTO expenses_archive_fts (expenses_archive_fts) VALUES ('rebuild')")
+
+    # Create expense_rollups table with monthly totals of archived expenses
+    legacy = rename_legacy_table(c, 'expense_rollups', 'category')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS expense_rollups
+        (user_id INTEGER NOT NULL,
+         month TEXT NOT NULL,
+         category_id INTEGER NOT NULL,
+         amount REAL NOT NULL,
+         count INTEGER NOT NULL,
+         PRIMARY KEY (user_id, month, category_id),
+         FOREIGN KEY (user_id) REFERENCES users (id),
+         FOREIGN KEY (category_id) REFERENCES expense_categories (id))
+    ''')
+    if legacy:
+        copy_legacy_rows(c, 'expense_rollups', 'category', 'category_id', 'expense_categories', '''
+            ON CONFLICT (user_id, month, category_id) DO UPDATE SET
+                amount = amount + excluded.amount, count = count + excluded.count
+        ''')
+
+    # Create expense_archive_bounds table; a user's expenses dated before
+    # archived_before may be in the archive, later ones are all live
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS expense_archive_bounds
+        (user_id INTEGER PRIMARY KEY,
+         archived_before DATE NOT NULL,
+         FOREIGN KEY (user_id) REFERENCES users (id))
+    ''')
+
+    # Create expense_totals table with running totals per month and category,
+    # kept by the expense write paths so budget checks never rescan expenses
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'expense_totals'")
+    totals_exist = c.fetchone() is not None
+    legacy = rename_legacy_table(c, 'expense_totals', 'category')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS expense_totals
+        (user_id INTEGER NOT NULL,
+         month TEXT NOT NULL,
+         category_id INTEGER NOT NULL,
+         amount REAL NOT NULL,
+         PRIMARY KEY (user_id, month, category_id),
+         FOREIGN KEY (user_id) REFERENCES users (id),
+         FOREIGN KEY (category_id) REFERENCES expense_categories (id))
+    ''')
+    if legacy:
+        copy_legacy_rows(c, 'expense_totals', 'category', 'category_id', 'expense_categories',
+                         'ON CONFLICT (user_id, month, category_id) DO UPDATE SET amount = amount + excluded.amount')
+    if not totals_exist:
+        # Total the expenses recorded before running totals existed
+        c.execute('''
+            INSERT INTO expense_totals (user_id, month, category_id, amount)
+            SELECT user_id, strftime('%Y-%m', date) AS month, category_id, SUM(amount)
+            FROM (SELECT user_id, date, category_id, amount FROM expenses
+                  UNION ALL
+                  SELECT user_id, date, category_id, amount FROM expenses_archive)
+            GROUP BY user_id, month, category_id
+        ''')
+
+    # Create alert_outbox table holding budget alerts until the dispatcher in
+    # alerts.py delivers them; one alert per threshold, month and category
+    legacy = rename_legacy_table(c, 'alert_outbox', 'category')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_outbox
+        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+         user_id INTEGER NOT NULL,
+         month TEXT NOT NULL,
+         category_id INTEGER NOT NULL,
+         threshold REAL NOT NULL,
+         message TEXT NOT NULL,
+         status TEXT NOT NULL DEFAULT 'pending',
+         attempts INTEGER NOT NULL DEFAULT 0,
+         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+         sent_at TIMESTAMP,
+         UNIQUE(user_id, month, category_id, threshold),
+         FOREIGN KEY (user_id) REFERENCES users (id),
+         FOREIGN KEY (category_id) REFERENCES expense_categories (id))
+    ''')
+    if legacy:
+        copy_legacy_rows(c, 'alert_outbox', 'category', 'category_id', 'expense_categories',
+                         'ON CONFLICT DO NOTHING')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_alert_outbox_status ON alert_outbox (status, id)')
+
+    # Create user_versions table, bumped by every change to a user's buckets,
+    # budget or goals so sessions can tell when their cached copy is stale;
+    # expenses_version is bumped by every change to their expenses
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS user_versions
+        (user_id INTEGER PRIMARY KEY,
+         version INTEGER NOT NULL,
+         expenses_version INTEGER NOT NULL DEFAULT 0,
+         FOREIGN KEY (user_id) REFERENCES users (id))
+    ''')
+    add_column_if_missing(c, 'user_versions', 'expenses_version', 'INTEGER NOT NULL DEFAULT 0')
+
+    # Create category_tokens table holding each user's categorizer model
+    legacy = rename_legacy_table(c, 'category_tokens', 'category')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS category_tokens
+        (user_id INTEGER NOT NULL,
+         token TEXT NOT NULL,
+         category_id INTEGER NOT NULL,
+         count INTEGER NOT NULL,
+         PRIMARY KEY (user_id, token, category_id),
+         FOREIGN KEY (user_id) REFERENCES users (id),
+         FOREIGN KEY (category_id) REFERENCES expense_categories (id))
+    ''')
+    if legacy:
+        copy_legacy_rows(c, 'category_tokens', 'category', 'category_id', 'expense_categories',
+                         'ON CONFLICT (user_id, token, category_id) DO UPDATE SET count = count + excluded.count')
+
+    # Create user_summaries table with the figures the overview page shows,
+    # computed by overview.py as of a data version and month. The expense
+    # write paths add to month_spent and budget_points as they go.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS user_summaries
+        (user_id INTEGER PRIMARY KEY,
+         version INTEGER NOT NULL,
+         month TEXT NOT NULL,
+         net_worth REAL NOT NULL,
+         month_spent REAL NOT NULL,
+         month_budget REAL NOT NULL,
+         budget_points REAL NOT NULL,
+         savings_score REAL NOT NULL,
+         diversification_score REAL NOT NULL,
+         goal_count INTEGER NOT NULL,
+         goals_reached INTEGER NOT NULL,
+         goal_saved REAL NOT NULL,
+         goal_target REAL NOT NULL,
+         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+         FOREIGN KEY (user_id) REFERENCES users (id))
+    ''')
+
     conn.commit()
+
+def table_columns(c, table):
+    return [row['name'] for row in c.execute(f'PRAGMA table_info({table})')]
+
+def drop_outdated_search_index(c, table):
+    """Drop a table's search index, view and triggers unless they have the owner column
+
+    Returns whether an up-to-date index is in place.
+    """
+    if 'owner' in table_columns(c, f'{table}_search'):
+        return True
+    for trigger in ('insert', 'delete', 'update'):
+        c.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{trigger}')
+    c.execute(f'DROP VIEW IF EXISTS {table}_search')
+    c.execute(f'DROP TABLE IF EXISTS {table}_fts')
+    return False
+
+def add_column_if_missing(c, table, column, definition):
+    """Add a column to a table created before the column existed"""
+    if column not in table_columns(c, table):
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def rename_legacy_table(c, table, column):
+    """Move aside a table that still stores a label as text, so it is recreated with an id column
+
+    Its indexes and triggers are dropped first so the new table can take
+    their names. Returns whether the table was moved.
+    """
+    if column not in table_columns(c, table):
+        return False
+    for row in c.execute('''
+        SELECT type, name FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    ''', (table,)).fetchall():
+        c.execute(f'DROP {row["type"].upper()} {row["name"]}')
+    # Legacy mode stops SQLite from repointing other tables' foreign keys
+    # and views at the moved table, which is dropped once its rows are copied
+    c.execute('PRAGMA legacy_alter_table = ON')
+    c.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+    c.execute('PRAGMA legacy_alter_table = OFF')
+    return True
+
+def repair_legacy_references(c):
+    """Repair tables and views an earlier migration pointed at a dropped *_legacy table
+
+    Tables are rebuilt without the _legacy suffix in their foreign keys and
+    views are dropped; create_schema recreates the views and the rebuilt
+    tables' indexes and triggers afterwards.
+    """
+    for row in c.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('table', 'view') AND name NOT LIKE '%\\_legacy' ESCAPE '\\'
+            AND sql LIKE '%\\_legacy%' ESCAPE '\\'
+    ''').fetchall():
+        table = row['name']
+        if row['type'] == 'view':
+            c.execute(f'DROP VIEW {table}')
+            continue
+        sql = re.sub(r'"(\w+)_legacy"', r'\1', row['sql'])
+        c.execute(sql.replace(table, f'{table}_rebuilt', 1))
+        c.execute(f'INSERT INTO {table}_rebuilt SELECT * FROM {table}')
+        c.execute(f'DROP TABLE {table}')
+        c.execute(f'ALTER TABLE {table}_rebuilt RENAME TO {table}')
+
+def copy_legacy_rows(c, table, column, id_column, lookup, on_conflict=''):
+    """Copy a moved-aside table's rows into its replacement, turning labels into ids, and drop it
+
+    on_conflict is an upsert clause merging rows whose labels both fall
+    back to the same label.
+    """
+    legacy = f'{table}_legacy'
+    columns = [col for col in table_columns(c, table) if col in table_columns(c, legacy)]
+    known = LABEL_TABLES[lookup]
+    c.execute(f'''
+        INSERT INTO {table} ({', '.join(columns)}, {id_column})
+        SELECT {', '.join('t.' + col for col in columns)}, l.id
+        FROM {legacy} t JOIN {lookup} l
+            ON l.name = CASE WHEN t.{column} IN ({', '.join('?' for _ in known)}) THEN t.{column} ELSE ? END
+        WHERE true {on_conflict}
+    ''', (*known, LABEL_FALLBACKS[lookup]))
+    # Keep handing out ids after the old table's, so deleted ids are not reused
+    c.execute('DELETE FROM sqlite_sequence WHERE name = ? AND EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)',
+              (table, legacy))
+    c.execute('UPDATE sqlite_sequence SET name = ? WHERE name = ?', (table, legacy))
+    c.execute(f'DROP TABLE {legacy}')
+
+# Label operations
+def read_labels(lookup):
+    """Get the (id, name) rows of a lookup table from the user directory"""
+    conn = get_db_connection()
+    rows = [tuple(row) for row in conn.execute(f'SELECT id, name FROM {lookup}')]
     conn.close()
+    return rows
+
+def sync_labels(c):
+    """Copy every label id from the user directory into another database"""
+    for lookup in LABEL_TABLES:
+        copy_labels(c, lookup, read_labels(lookup))
+
+def copy_labels(c, lookup, rows):
+    """Copy (id, name) rows from the user directory into another database"""
+    c.executemany(f'INSERT OR IGNORE INTO {lookup} (id, name) VALUES (?, ?)', rows)
+
+# Process-wide {name: id} and {id: name} dictionaries per lookup table.
+# Labels are never renamed or removed, so entries never go stale; an
+# unknown name or id just triggers a reload.
+_label_ids = {}
+_label_names = {}
+_labels_lock = threading.Lock()
+
+def load_labels(lookup):
+    rows = read_labels(lookup)
+    _label_ids[lookup] = {name: label_id for label_id, name in rows}
+    _label_names[lookup] = {label_id: name for label_id, name in rows}
+
+def label_ids(lookup, names):
+    """Get the id of each label, raising ValueError for a name not in the lookup's list"""
+    unknown = set(names) - set(LABEL_TABLES[lookup])
+    if unknown:
+        raise ValueError(f"Unknown {lookup.replace('_', ' ')}: {', '.join(sorted(map(str, unknown)))}")
+    with _labels_lock:
+        if lookup not in _label_ids or not set(names) <= _label_ids[lookup].keys():
+            load_labels(lookup)
+        ids = _label_ids[lookup]
+        return [ids[name] for name in names]
+
+def label_names(lookup, ids=()):
+    """Get the {id: name} dictionary of a lookup table, reloaded if it lacks any of ids"""
+    with _labels_lock:
+        if lookup not in _label_names or not set(ids) <= _label_names[lookup].keys():
+            load_labels(lookup)
+        return _label_names[lookup]
+
+def decode_labels(lookup, ids):
+    """Turn label ids into a Categorical of their names, decoding each distinct id once"""
+    present, codes = np.unique(np.asarray(ids, dtype='int64'), return_inverse=True)
+    names = label_names(lookup, present.tolist())
+    return pd.Categorical.from_codes(codes, categories=[names[label_id] for label_id in present.tolist()])
+
+# Column dtypes holding a label id, with the lookup table and the column
+# storing the id; frames get the names as a category column
+LABEL_DTYPES = {
+    'expense_category': ('expense_categories', 'category_id'),
+    'goal_category': ('goal_categories', 'category_id'),
+    'bucket_type': ('bucket_types', 'type_id'),
+}
+
+def named_dtypes(dtypes):
+    """Map label dtypes to 'category', for frames built from label names rather than ids"""
+    return {name: 'category' if dtype in LABEL_DTYPES else dtype for name, dtype in dtypes.items()}
+
+def query_frame(conn, sql, params, dtypes):
+    """Build a DataFrame straight from cursor rows with a compact dtype per column"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return frame_from_rows(cursor.execute(sql, params).fetchall(), dtypes)
+
+def frame_from_rows(rows, dtypes):
+    """Build a DataFrame from row tuples
+
+    dtypes maps each column to a numpy dtype, 'category', 'datetime', a
+    label dtype from LABEL_DTYPES or None to let pandas infer it.
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(dtypes)
+    data = {}
+    for (name, dtype), values in zip(dtypes.items(), columns):
+        if dtype == 'category':
+            data[name] = pd.Categorical(values)
+        elif dtype in LABEL_DTYPES:
+            data[name] = decode_labels(LABEL_DTYPES[dtype][0], values)
+        elif dtype == 'datetime':
+            data[name] = pd.to_datetime(pd.Series(values, dtype=object), format='ISO8601')
+        elif dtype is None:
+            data[name] = pd.Series(values, dtype=object).infer_objects()
+        else:
+            data[name] = pd.Series(values, dtype=dtype)
+    return pd.DataFrame(data)
+
+def get_user_ids(shard=None):
+    """Get all user ids, optionally only those stored on one shard"""
+    conn = get_db_connection()
+    user_ids = [row['id'] for row in conn.execute('SELECT id FROM users ORDER BY id')]
+    conn.close()
+    if shard is None:
+        return user_ids
+    return [user_id for user_id in user_ids if sharding.shard_for_user(user_id) == shard]
 
 # User operations
 def create_user(username, password, email):
+    """Add a user, returning False if the username or email is taken
+
+    Raises passwords.HashingBusy if the hashing pool is full.
+    """
+    password_hash = passwords.hash_password(password)
     conn = get_db_connection()
     c = conn.cursor()
     try:
         c.execute(
             'INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)',
-            (username, hash_password(password), email)
+            (username, password_hash, email)
         )
         conn.commit()
         return True
@@ -103,24 +596,44 @@ def create_user(username, password, email):
         conn.close()
 
 def verify_user(username, password):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT id, username FROM users WHERE username = ? AND password_hash = ?',
-              (username, hash_password(password)))
-    user = c.fetchone()
-    conn.close()
-    return dict(user) if user else None
+    """Check a username and password and return the user, or None
+
+    Raises passwords.LoginThrottled while the username must wait after
+    failed attempts, or passwords.HashingBusy if the hashing pool is full.
+    A legacy or outdated hash is replaced on success.
+    """
+    passwords.begin_attempt(username)
+    user = None
+    checked = False
+    try:
+        conn = get_db_connection()
+        row = conn.execute('SELECT id, username, password_hash FROM users WHERE username = ?',
+                           (username,)).fetchone()
+        conn.close()
+        matched, new_hash = passwords.verify_password(password, row['password_hash'] if row else None)
+        checked = True
+        if row and matched:
+            user = {'id': row['id'], 'username': row['username']}
+            if new_hash:
+                conn = get_db_connection()
+                conn.execute('UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                             (new_hash, row['id'], row['password_hash']))
+                conn.commit()
+                conn.close()
+    finally:
+        # Only a password that was actually checked counts towards throttling;
+        # a full hashing pool or a database error just gives the attempt back
+        if checked:
+            passwords.end_attempt(username, user is not None)
+        else:
+            passwords.cancel_attempt(username)
+    return user
 
 def get_or_create_auth0_user(auth0_id, email, name):
     """Get or create user from Auth0 credentials"""
     conn = get_db_connection()
     c = conn.cursor()
 
-    # Add auth0_id column if it doesn't exist
-    c.execute('''
-        ALTER TABLE users ADD COLUMN IF NOT EXISTS auth0_id TEXT UNIQUE
-    ''')
-
     # Try to find existing user
     c.execute('SELECT id, username FROM users WHERE auth0_id = ?', (auth0_id,))
     user = c.fetchone()
@@ -146,114 +659,543 @@ def get_or_create_auth0_user(auth0_id, email, name):
         conn.close()
         return None
 
-# Bucket operations
-def add_bucket(user_id, name, amount, bucket_type):
+def get_user_contact(user_id):
+    """Get a user's username, email and phone number for alerts"""
+    conn = get_db_connection()
+    row = conn.execute('SELECT id, username, email, phone FROM users WHERE id = ?', (user_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def set_user_phone(user_id, phone):
+    """Set the phone number budget alerts are sent to, or clear it with None"""
     conn = get_db_connection()
+    conn.execute('UPDATE users SET phone = ? WHERE id = ?', (phone, user_id))
+    conn.commit()
+    conn.close()
+
+def bump_data_version(c, user_id):
+    """Record a change to a user's buckets, budget or goals"""
+    c.execute('''
+        INSERT INTO user_versions (user_id, version) VALUES (?, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+    ''', (user_id,))
+
+def bump_expenses_version(c, user_id):
+    """Record a change to a user's expenses"""
+    c.execute('''
+        INSERT INTO user_versions (user_id, version, expenses_version) VALUES (?, 0, 1)
+        ON CONFLICT (user_id) DO UPDATE SET expenses_version = expenses_version + 1
+    ''', (user_id,))
+
+def get_data_versions(user_id):
+    """Get the change counters for a user's buckets, budget and goals and for their expenses"""
+    conn = get_db_connection(user_id)
+    row = conn.execute('SELECT version, expenses_version FROM user_versions WHERE user_id = ?',
+                       (user_id,)).fetchone()
+    conn.close()
+    return (row['version'], row['expenses_version']) if row else (0, 0)
+
+# Columns selected by the getters, with the dtype each is loaded as
+BUCKET_COLUMNS = {'id': 'int64', 'name': None, 'amount': 'float64', 'type': 'bucket_type',
+                  'currency': 'category'}
+EXPENSE_COLUMNS = {'id': 'int64', 'date': 'datetime', 'category': 'expense_category', 'amount': 'float64',
+                   'description': None, 'duplicate_of': 'float64'}
+BUDGET_COLUMNS = {'category': 'expense_category', 'amount': 'float64'}
+GOAL_COLUMNS = {'id': 'int64', 'name': None, 'target_amount': 'float64', 'deadline': 'datetime',
+                'category': 'goal_category'}
+
+def select_list(columns, alias=None):
+    """Join column names into a SELECT list, selecting label columns by their stored id"""
+    prefix = f"{alias}." if alias else ''
+    return ', '.join(
+        f"{prefix}{LABEL_DTYPES[dtype][1]} AS {column}" if dtype in LABEL_DTYPES else prefix + column
+        for column, dtype in columns.items()
+    )
+
+# Bucket operations
+def add_bucket(user_id, name, amount, bucket_type, currency='CAD'):
+    """Add a bucket and return its ID"""
+    type_id = label_ids('bucket_types', [bucket_type])[0]
+    conn = get_db_connection(user_id)
     c = conn.cursor()
-    c.execute('INSERT INTO buckets (user_id, name, amount, type) VALUES (?, ?, ?, ?)', 
-              (user_id, name, amount, bucket_type))
+    c.execute('INSERT INTO buckets (user_id, name, amount, type_id, currency) VALUES (?, ?, ?, ?, ?)', 
+              (user_id, name, amount, type_id, currency))
+    bucket_id = c.lastrowid
+    bump_data_version(c, user_id)
     conn.commit()
     conn.close()
+    return bucket_id
 
 def get_buckets(user_id):
-    conn = get_db_connection()
-    df = pd.read_sql_query('SELECT * FROM buckets WHERE user_id = ?', conn, params=(user_id,))
+    conn = get_db_connection(user_id)
+    df = query_frame(conn, f'SELECT {select_list(BUCKET_COLUMNS)} FROM buckets WHERE user_id = ?',
+                     (user_id,), BUCKET_COLUMNS)
     conn.close()
     return df
 
 def update_bucket(bucket_id, amount, user_id):
-    conn = get_db_connection()
+    conn = get_db_connection(user_id)
     c = conn.cursor()
     c.execute('UPDATE buckets SET amount = ? WHERE id = ? AND user_id = ?', 
               (amount, bucket_id, user_id))
+    bump_data_version(c, user_id)
     conn.commit()
     conn.close()
 
 # Expense operations
-def add_expense(user_id, category, amount, date, description):
-    conn = get_db_connection()
+def expense_fingerprint(user_id, date, amount, description):
+    """Hash the fields that identify an expense, ignoring case, spacing and punctuation in the description"""
+    normalized = ' '.join(re.findall(r'\w+', (description or '').lower()))
+    key = f"{user_id}|{str(date)[:10]}|{float(amount):.2f}|{normalized}"
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+def add_expense(user_id, category, amount, date, description, allow_duplicate=False):
+    """Add an expense and return its ID, or None if it duplicates an existing expense
+
+    With allow_duplicate the expense is added anyway and flagged as a
+    duplicate of the existing one.
+    """
+    fingerprint = expense_fingerprint(user_id, date, amount, description)
+    category_id = label_ids('expense_categories', [category])[0]
+    conn = get_db_connection(user_id)
     c = conn.cursor()
-    c.execute('INSERT INTO expenses (user_id, category, amount, date, description) VALUES (?, ?, ?, ?, ?)',
-              (user_id, category, amount, date, description))
+    # The check and the insert share one write transaction, so a form
+    # submitted twice at once can't get both copies past the check
+    c.execute('BEGIN IMMEDIATE')
+    # Archived expenses count too, so re-importing an old statement is caught
+    c.execute('''
+        SELECT MIN(id) FROM (SELECT id FROM expenses WHERE fingerprint = ?
+                             UNION ALL
+                             SELECT id FROM expenses_archive WHERE fingerprint = ?)
+    ''', (fingerprint, fingerprint))
+    duplicate_of = c.fetchone()[0]
+    if duplicate_of is not None and not allow_duplicate:
+        conn.rollback()
+        conn.close()
+        return None
+    c.execute('''
+        INSERT INTO expenses (user_id, category_id, amount, date, description, fingerprint, duplicate_of)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, category_id, amount, date, description, fingerprint, duplicate_of))
+    expense_id = c.lastrowid
+    add_to_expense_totals(c, user_id, [(category_id, amount, date)])
     conn.commit()
     conn.close()
+    return expense_id
+
+def add_expenses(user_id, expenses, allow_duplicates=False):
+    """Add (category, amount, date, description) rows in one transaction
+
+    Returns the rows that were skipped as duplicates of existing expenses
+    or of earlier rows in the same batch. With allow_duplicates every row
+    is added and duplicates are flagged, as add_expense does.
+    """
+    expenses = list(expenses)
+    category_ids = label_ids('expense_categories', [expense[0] for expense in expenses])
+    rows = [(user_id, category_id, amount, date, description,
+             expense_fingerprint(user_id, date, amount, description))
+            for category_id, (_, amount, date, description) in zip(category_ids, expenses)]
+    conn = get_db_connection(user_id)
+    c = conn.cursor()
+    # Check and insert in one write transaction, as add_expense does
+    c.execute('BEGIN IMMEDIATE')
+    first_ids = {}
+    fingerprints = list({row[-1] for row in rows})
+    for start in range(0, len(fingerprints), 500):
+        chunk = fingerprints[start:start + 500]
+        placeholders = ', '.join('?' for _ in chunk)
+        c.execute(f'''
+            SELECT fingerprint, MIN(id) AS first_id FROM (
+                SELECT fingerprint, id FROM expenses WHERE fingerprint IN ({placeholders})
+                UNION ALL
+                SELECT fingerprint, id FROM expenses_archive WHERE fingerprint IN ({placeholders}))
+            GROUP BY fingerprint
+        ''', chunk + chunk)
+        first_ids.update((row['fingerprint'], row['first_id']) for row in c.fetchall())
+
+    new_rows, duplicates, seen, repeated = [], [], set(first_ids), set()
+    for row, expense in zip(rows, expenses):
+        fingerprint = row[-1]
+        if fingerprint in seen:
+            if not allow_duplicates:
+                duplicates.append(tuple(expense))
+                continue
+            if fingerprint not in first_ids:
+                repeated.add(fingerprint)
+        seen.add(fingerprint)
+        new_rows.append(row + (first_ids.get(fingerprint),))
+    c.executemany('''
+        INSERT INTO expenses (user_id, category_id, amount, date, description, fingerprint, duplicate_of)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', new_rows)
+    # Repeats of an expense first added by this batch point at its first copy
+    c.executemany('''
+        UPDATE expenses SET duplicate_of = (SELECT MIN(id) FROM expenses WHERE fingerprint = ?)
+        WHERE fingerprint = ? AND id != (SELECT MIN(id) FROM expenses WHERE fingerprint = ?)
+    ''', [(fingerprint,) * 3 for fingerprint in repeated])
+    add_to_expense_totals(c, user_id, [(row[1], row[2], row[3]) for row in new_rows])
+    conn.commit()
+    conn.close()
+    return duplicates
+
+# Alerts are queued when a month's spending in a category first reaches
+# these fractions of its budget
+ALERT_THRESHOLDS = (0.8, 1.0)
+
+def add_to_expense_totals(c, user_id, expenses):
+    """Add (category_id, amount, date) rows to the running month totals and queue budget alerts
+
+    Each month and category costs one upsert and one budget lookup, however
+    many expenses the month already holds. Alerts are only queued for the
+    current month, so importing old statements stays quiet.
+    """
+    added = {}
+    for category_id, amount, date in expenses:
+        key = (str(date)[:7], category_id)
+        added[key] = added.get(key, 0.0) + float(amount)
+    if added:
+        bump_expenses_version(c, user_id)
+
+    current_month = datetime.now().strftime('%Y-%m')
+    for (month, category_id), amount in added.items():
+        total = c.execute('''
+            INSERT INTO expense_totals (user_id, month, category_id, amount) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, month, category_id) DO UPDATE SET amount = amount + excluded.amount
+            RETURNING amount
+        ''', (user_id, month, category_id, amount)).fetchone()[0]
+        if month != current_month:
+            continue
+        budget = c.execute('SELECT amount FROM budget WHERE user_id = ? AND category_id = ?',
+                           (user_id, category_id)).fetchone()
+        add_to_summary(c, user_id, month, total, amount, budget[0] if budget else None)
+        if not budget or budget[0] <= 0:
+            continue
+        category = label_names('expense_categories', [category_id])[category_id]
+        for threshold in ALERT_THRESHOLDS:
+            limit = budget[0] * threshold
+            if total - amount < limit <= total:
+                if threshold >= 1:
+                    message = f"You're over your {category} budget: ${total:,.2f} spent of ${budget[0]:,.2f}"
+                else:
+                    message = f"You've used {total / budget[0]:.0%} of your {category} budget: ${total:,.2f} of ${budget[0]:,.2f}"
+                c.execute('''
+                    INSERT OR IGNORE INTO alert_outbox (user_id, month, category_id, threshold, message)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (user_id, month, category_id, threshold, message))
+
+def budget_points(spent, budget):
+    """Score a category's spending against its budget, weighted by the budget
+
+    Summed over categories and divided by the total budget this gives the
+    budget score of financial_health.calculate_budget_score.
+    """
+    return 100 * max(0.0, budget - abs(spent - budget)) if budget and budget > 0 else 0.0
+
+def add_to_summary(c, user_id, month, total, amount, budget):
+    """Apply a change of amount to a category now totalling total to a user's overview summary"""
+    points = budget_points(total, budget) - budget_points(total - amount, budget)
+    c.execute('''
+        UPDATE user_summaries SET month_spent = month_spent + ?, budget_points = budget_points + ?
+        WHERE user_id = ? AND month = ?
+    ''', (amount, points, user_id, month))
+
+def get_month_totals(user_id, month):
+    """Get a user's spending per category for a YYYY-MM month from the running totals"""
+    conn = get_db_connection(user_id)
+    rows = conn.execute('SELECT category_id, amount FROM expense_totals WHERE user_id = ? AND month = ?',
+                        (user_id, month)).fetchall()
+    conn.close()
+    names = label_names('expense_categories', [row['category_id'] for row in rows])
+    return {names[row['category_id']]: row['amount'] for row in rows}
+
+def month_bounds(month):
+    """Get the first day of a YYYY-MM month and of the month after it"""
+    start = pd.Period(month, freq='M')
+    return start.start_time.strftime('%Y-%m-%d'), (start + 1).start_time.strftime('%Y-%m-%d')
+
+# Live and archived expenses, each with its search index
+EXPENSE_TIERS = [('expenses', 'expenses_fts'), ('expenses_archive', 'expenses_archive_fts')]
+
+def includes_archive(conn, user_id, start=None):
+    """Tell whether a query from start, or over all dates, can reach a user's archived expenses"""
+    row = conn.execute('SELECT archived_before FROM expense_archive_bounds WHERE user_id = ?',
+                       (user_id,)).fetchone()
+    return row is not None and (start is None or start < row['archived_before'])
+
+def tiered_query(conn, user_id, start, template, params):
+    """Build a per-tier query over the live expenses and, only if start reaches it, the archive
+
+    template names the tier with {table} and its search index with {fts}.
+    Returns the UNION ALL of the tiers and the parameters repeated to match.
+    """
+    tiers = EXPENSE_TIERS if includes_archive(conn, user_id, start) else EXPENSE_TIERS[:1]
+    sql = ' UNION ALL '.join(template.format(table=table, fts=fts) for table, fts in tiers)
+    return sql, tuple(params) * len(tiers)
 
 def get_expenses(user_id, month=None):
-    conn = get_db_connection()
+    conn = get_db_connection(user_id)
+    template = f'SELECT {select_list(EXPENSE_COLUMNS)} FROM {{table}} WHERE user_id = ?'
     if month:
-        df = pd.read_sql_query(
-            'SELECT * FROM expenses WHERE user_id = ? AND strftime("%Y-%m", date) = ?',
-            conn,
-            params=(user_id, month)
-        )
+        # A date range instead of strftime() lets SQLite use the (user_id, date) index
+        start, end = month_bounds(month)
+        sql, params = tiered_query(conn, user_id, start, template + ' AND date >= ? AND date < ?',
+                                   (user_id, start, end))
     else:
-        df = pd.read_sql_query('SELECT * FROM expenses WHERE user_id = ?', conn, params=(user_id,))
+        sql, params = tiered_query(conn, user_id, None, template, (user_id,))
+    df = query_frame(conn, sql, params, EXPENSE_COLUMNS)
     conn.close()
     return df
 
 def delete_expense(expense_id, user_id):
-    """Delete an expense for a user"""
-    conn = get_db_connection()
+    """Delete an expense for a user, taking it out of the rollups if it was archived"""
+    conn = get_db_connection(user_id)
     c = conn.cursor()
-    c.execute('DELETE FROM expenses WHERE id = ? AND user_id = ?', 
-              (expense_id, user_id))
+    for table in ('expenses', 'expenses_archive'):
+        expense = c.execute(f'''
+            SELECT strftime('%Y-%m', date) AS month, category_id, amount FROM {table}
+            WHERE id = ? AND user_id = ?
+        ''', (expense_id, user_id)).fetchone()
+        if expense:
+            c.execute(f'DELETE FROM {table} WHERE id = ?', (expense_id,))
+            bump_expenses_version(c, user_id)
+            total = c.execute('''
+                UPDATE expense_totals SET amount = amount - ?
+                WHERE user_id = ? AND month = ? AND category_id = ?
+                RETURNING amount
+            ''', (expense['amount'], user_id, expense['month'], expense['category_id'])).fetchone()
+            if total and expense['month'] == datetime.now().strftime('%Y-%m'):
+                budget = c.execute('SELECT amount FROM budget WHERE user_id = ? AND category_id = ?',
+                                   (user_id, expense['category_id'])).fetchone()
+                add_to_summary(c, user_id, expense['month'], total[0], -expense['amount'],
+                               budget[0] if budget else None)
+            if table == 'expenses_archive':
+                c.execute('''
+                    UPDATE expense_rollups SET amount = amount - ?, count = count - 1
+                    WHERE user_id = ? AND month = ? AND category_id = ?
+                ''', (expense['amount'], user_id, expense['month'], expense['category_id']))
+            break
+    conn.commit()
+    conn.close()
+
+def to_fts_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+def user_fts_query(user_id, query):
+    """Limit an FTS5 query to one user's rows and to the description and category columns"""
+    return f'owner : u{int(user_id)} AND {{description category}} : ({query})'
+
+def search_expenses(user_id, text, limit=100):
+    """Get a user's live and archived expenses matching a search, best matches first"""
+    query = to_fts_query(text)
+    if not query:
+        return frame_from_rows([], EXPENSE_COLUMNS)
+    conn = get_db_connection(user_id)
+    # The owner column only scopes the match, so it carries no weight in the ranking
+    matches, params = tiered_query(conn, user_id, None, f'''
+        SELECT {select_list(EXPENSE_COLUMNS, 'e')}, bm25({{fts}}, 0.0, 1.0, 1.0) AS rank
+        FROM {{fts}}
+        JOIN {{table}} e ON e.id = {{fts}}.rowid
+        WHERE {{fts}} MATCH ?
+    ''', (user_fts_query(user_id, query),))
+    df = query_frame(conn, f'''
+        SELECT {', '.join(EXPENSE_COLUMNS)} FROM ({matches})
+        ORDER BY rank
+        LIMIT ?
+    ''', (*params, limit), EXPENSE_COLUMNS)
+    conn.close()
+    return df
+
+SEARCH_TOTAL_COLUMNS = {'month': None, 'category': 'expense_category', 'amount': 'float64', 'count': 'int64'}
+
+def get_search_totals(user_id, text):
+    """Get totals per month and category for a user's expenses matching a search"""
+    query = to_fts_query(text)
+    if not query:
+        return frame_from_rows([], SEARCH_TOTAL_COLUMNS)
+    conn = get_db_connection(user_id)
+    matches, params = tiered_query(conn, user_id, None, '''
+        SELECT e.date, e.category_id, e.amount
+        FROM {fts}
+        JOIN {table} e ON e.id = {fts}.rowid
+        WHERE {fts} MATCH ?
+    ''', (user_fts_query(user_id, query),))
+    df = query_frame(conn, f'''
+        SELECT strftime('%Y-%m', date) AS month, category_id,
+               SUM(amount) AS amount, COUNT(*) AS count
+        FROM ({matches})
+        GROUP BY month, category_id
+        ORDER BY month, category_id
+    ''', params, SEARCH_TOTAL_COLUMNS)
+    conn.close()
+    return df
+
+def iter_expense_descriptions(user_id):
+    """Yield (category, description) for every live and archived expense of a user"""
+    conn = get_db_connection(user_id)
+    try:
+        sql, params = tiered_query(conn, user_id, None, '''
+            SELECT l.name, t.description FROM {table} t
+            JOIN expense_categories l ON l.id = t.category_id
+            WHERE t.user_id = ?
+        ''', (user_id,))
+        yield from conn.execute(sql, params)
+    finally:
+        conn.close()
+
+# Categorizer operations
+def get_category_tokens(user_id):
+    """Get a user's (token, category, count) categorizer rows"""
+    conn = get_db_connection(user_id)
+    rows = conn.execute('''
+        SELECT t.token, l.name, t.count FROM category_tokens t
+        JOIN expense_categories l ON l.id = t.category_id
+        WHERE t.user_id = ?
+    ''', (user_id,)).fetchall()
+    conn.close()
+    return rows
+
+def add_category_tokens(user_id, token_counts):
+    """Add (token, category, count) rows to a user's categorizer model"""
+    category_ids = label_ids('expense_categories', [category for _, category, _ in token_counts])
+    conn = get_db_connection(user_id)
+    conn.executemany('''
+        INSERT INTO category_tokens (user_id, token, category_id, count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, token, category_id) DO UPDATE SET count = count + excluded.count
+    ''', [(user_id, token, category_id, count)
+          for category_id, (token, _, count) in zip(category_ids, token_counts)])
     conn.commit()
     conn.close()
 
+# Report operations
+REPORT_COLUMNS = ['month', 'category', 'spent', 'expenses', 'budget', 'budget_used_pct',
+                  'category_running_total', 'month_total', 'month_share_pct']
+
+def report_sources(conn, user_id, start, end):
+    """Build the (month, category_id, amount, count) rows a report sums, with their parameters
+
+    Archived months that the range covers in full are read from the monthly
+    rollups; archived rows are only read for partial months at its edges.
+    """
+    sources = '''
+        SELECT strftime('%Y-%m', date) AS month, category_id, amount, 1 AS count
+        FROM expenses WHERE user_id = ? AND date >= ? AND date < ?
+    '''
+    params = (user_id, start, end)
+    if not includes_archive(conn, user_id, start):
+        return sources, params
+
+    first_full = pd.Timestamp(start).to_period('M')
+    if pd.Timestamp(start).day != 1:
+        first_full += 1
+    end_full = pd.Timestamp(end).to_period('M')
+    full_start, full_end = first_full.strftime('%Y-%m'), end_full.strftime('%Y-%m')
+    sources += '''
+        UNION ALL
+        SELECT strftime('%Y-%m', date), category_id, amount, 1
+        FROM expenses_archive WHERE user_id = ? AND date >= ? AND date < ?
+            AND NOT (strftime('%Y-%m', date) >= ? AND strftime('%Y-%m', date) < ?)
+        UNION ALL
+        SELECT month, category_id, amount, count
+        FROM expense_rollups WHERE user_id = ? AND month >= ? AND month < ?
+    '''
+    params += (user_id, start, end, full_start, full_end, user_id, full_start, full_end)
+    return sources, params
+
+def iter_report_rows(user_id, start, end, chunk_size=500):
+    """Yield spending per month and category from start up to (not including) end
+
+    Each row carries the category's budget, its running total over the range
+    and its share of the month, computed by SQLite window functions. Rows are
+    fetched chunk by chunk, so memory stays flat however long the range.
+    """
+    conn = get_db_connection(user_id)
+    try:
+        sources, params = report_sources(conn, user_id, start, end)
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f'''
+            SELECT m.month, l.name, ROUND(m.spent, 2), m.expenses, b.amount,
+                   ROUND(100.0 * m.spent / b.amount, 1),
+                   ROUND(SUM(m.spent) OVER (PARTITION BY m.category_id ORDER BY m.month), 2),
+                   ROUND(SUM(m.spent) OVER (PARTITION BY m.month), 2),
+                   ROUND(100.0 * m.spent / SUM(m.spent) OVER (PARTITION BY m.month), 1)
+            FROM (
+                SELECT month, category_id, SUM(amount) AS spent, SUM(count) AS expenses
+                FROM ({sources})
+                GROUP BY month, category_id
+            ) m
+            JOIN expense_categories l ON l.id = m.category_id
+            LEFT JOIN budget b ON b.user_id = ? AND b.category_id = m.category_id
+            ORDER BY m.month, l.name
+        ''', (*params, user_id))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
 
 # Budget operations
 def set_budget(user_id, category, amount):
-    conn = get_db_connection()
+    category_id = label_ids('expense_categories', [category])[0]
+    conn = get_db_connection(user_id)
     c = conn.cursor()
     c.execute('''
-        INSERT OR REPLACE INTO budget (user_id, category, amount)
+        INSERT OR REPLACE INTO budget (user_id, category_id, amount)
         VALUES (?, ?, ?)
-    ''', (user_id, category, amount))
+    ''', (user_id, category_id, amount))
+    bump_data_version(c, user_id)
     conn.commit()
     conn.close()
 
 def get_budget(user_id):
-    conn = get_db_connection()
-    df = pd.read_sql_query(
-        'SELECT * FROM budget WHERE user_id = ?',
-        conn,
-        params=(user_id,)
-    )
+    conn = get_db_connection(user_id)
+    df = query_frame(conn, f'SELECT {select_list(BUDGET_COLUMNS)} FROM budget WHERE user_id = ?',
+                     (user_id,), BUDGET_COLUMNS)
     conn.close()
     return df
 
 def delete_budget(user_id, category):
-    conn = get_db_connection()
+    conn = get_db_connection(user_id)
     c = conn.cursor()
-    c.execute('DELETE FROM budget WHERE user_id = ? AND category = ?', 
-              (user_id, category))
+    c.execute('''
+        DELETE FROM budget
+        WHERE user_id = ? AND category_id = (SELECT id FROM expense_categories WHERE name = ?)
+    ''', (user_id, category))
+    bump_data_version(c, user_id)
     conn.commit()
     conn.close()
 
 # Goal operations
 def add_goal(user_id, name, target_amount, deadline, category):
     """Add a new goal and return its ID"""
-    conn = get_db_connection()
+    category_id = label_ids('goal_categories', [category])[0]
+    conn = get_db_connection(user_id)
     c = conn.cursor()
     c.execute('''
-        INSERT INTO goals (user_id, name, target_amount, deadline, category)
+        INSERT INTO goals (user_id, name, target_amount, deadline, category_id)
         VALUES (?, ?, ?, ?, ?)
-    ''', (user_id, name, target_amount, deadline, category))
+    ''', (user_id, name, target_amount, deadline, category_id))
     goal_id = c.lastrowid  # Get the ID of the newly inserted goal
+    bump_data_version(c, user_id)
     conn.commit()
     conn.close()
     return goal_id
 
 def get_goals(user_id):
-    conn = get_db_connection()
-    df = pd.read_sql_query('SELECT * FROM goals WHERE user_id = ?', conn, params=(user_id,))
+    conn = get_db_connection(user_id)
+    df = query_frame(conn, f'SELECT {select_list(GOAL_COLUMNS)} FROM goals WHERE user_id = ?',
+                     (user_id,), GOAL_COLUMNS)
     conn.close()
     return df
 
 
-def link_goal_to_buckets(goal_id, bucket_ids):
+def link_goal_to_buckets(goal_id, bucket_ids, user_id):
     """Link a goal to selected buckets"""
-    conn = get_db_connection()
+    conn = get_db_connection(user_id)
     c = conn.cursor()
     # Clear existing links
     c.execute('DELETE FROM goal_buckets WHERE goal_id = ?', (goal_id,))
@@ -261,24 +1203,61 @@ def link_goal_to_buckets(goal_id, bucket_ids):
     for bucket_id in bucket_ids:
         c.execute('INSERT INTO goal_buckets (goal_id, bucket_id) VALUES (?, ?)',
                  (goal_id, bucket_id))
+    bump_data_version(c, user_id)
     conn.commit()
     conn.close()
 
-def get_goal_buckets(goal_id):
+def get_goal_links(user_id):
+    """Get (goal_id, bucket_id) pairs for all of a user's goals"""
+    conn = get_db_connection(user_id)
+    rows = conn.execute('''
+        SELECT gb.goal_id, gb.bucket_id FROM goal_buckets gb
+        JOIN goals g ON g.id = gb.goal_id
+        WHERE g.user_id = ?
+    ''', (user_id,)).fetchall()
+    conn.close()
+    return [tuple(row) for row in rows]
+
+def get_goal_buckets(goal_id, user_id):
     """Get buckets linked to a goal"""
-    conn = get_db_connection()
-    df = pd.read_sql_query('''
-        SELECT b.* FROM buckets b
+    conn = get_db_connection(user_id)
+    df = query_frame(conn, f'''
+        SELECT {select_list(BUCKET_COLUMNS, 'b')} FROM buckets b
         JOIN goal_buckets gb ON b.id = gb.bucket_id
-        WHERE gb.goal_id = ?
-    ''', conn, params=(goal_id,))
+        WHERE gb.goal_id = ? AND b.user_id = ?
+    ''', (goal_id, user_id), BUCKET_COLUMNS)
     conn.close()
     return df
 
-def calculate_goal_current_amount(goal_id):
+def calculate_goal_current_amount(goal_id, user_id):
     """Calculate current amount from linked buckets"""
-    buckets_df = get_goal_buckets(goal_id)
+    buckets_df = get_goal_buckets(goal_id, user_id)
     return buckets_df['amount'].sum() if not buckets_df.empty else 0.0
 
+# Overview operations
+SUMMARY_COLUMNS = ['month', 'net_worth', 'month_spent', 'month_budget', 'budget_points', 'savings_score',
+                   'diversification_score', 'goal_count', 'goals_reached', 'goal_saved', 'goal_target']
+
+def get_user_summary(user_id):
+    """Get a user's overview summary with the data version it was computed at and the current one"""
+    conn = get_db_connection(user_id)
+    row = conn.execute('''
+        SELECT s.*, COALESCE(v.version, 0) AS current_version FROM user_summaries s
+        LEFT JOIN user_versions v ON v.user_id = s.user_id
+        WHERE s.user_id = ?
+    ''', (user_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def save_user_summary(user_id, version, summary):
+    """Store a user's overview summary, computed as of a data version"""
+    conn = get_db_connection(user_id)
+    conn.execute(f'''
+        INSERT OR REPLACE INTO user_summaries (user_id, version, {', '.join(SUMMARY_COLUMNS)})
+        VALUES (?, ?, {', '.join('?' for _ in SUMMARY_COLUMNS)})
+    ''', (user_id, version, *(summary[column] for column in SUMMARY_COLUMNS)))
+    conn.commit()
+    conn.close()
+
 # Initialize database
 init_db()
\ No newline at end of file
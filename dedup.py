@@ -0,0 +1,101 @@
+"""Fingerprint existing expenses and flag duplicates, one chunk at a time.
+
+Usage: python dedup.py [CHUNK_SIZE]
+"""
+import sys
+import threading
+import database as db
+import sharding
+
+# Archived expenses share the live table's id space, so duplicates are
+# found across both tiers
+TIERS = ('expenses', 'expenses_archive')
+
+def backfill_fingerprints(shard, chunk_size=1000):
+    """Fingerprint expenses recorded before fingerprints existed and return how many were updated"""
+    updated = 0
+    for table in TIERS:
+        last_id = 0
+        while True:
+            conn = sharding.connect_shard(shard)
+            rows = conn.execute(f'''
+                SELECT id, user_id, amount, date, description FROM {table}
+                WHERE id > ? AND fingerprint IS NULL
+                ORDER BY id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                conn.close()
+                break
+            conn.executemany(f'UPDATE {table} SET fingerprint = ? WHERE id = ?', [
+                (db.expense_fingerprint(row['user_id'], row['date'], row['amount'], row['description']), row['id'])
+                for row in rows
+            ])
+            conn.commit()
+            conn.close()
+            last_id = rows[-1]['id']
+            updated += len(rows)
+    return updated
+
+def chunk_bound(conn, last_fingerprint, chunk_size):
+    """Get the fingerprint ending the next chunk of about chunk_size rows per tier, or None for the last chunk"""
+    bounds = []
+    for table in TIERS:
+        row = conn.execute(f'''
+            SELECT fingerprint FROM {table} WHERE fingerprint > ?
+            ORDER BY fingerprint LIMIT 1 OFFSET ?
+        ''', (last_fingerprint, chunk_size - 1)).fetchone()
+        if row:
+            bounds.append(row['fingerprint'])
+    return min(bounds) if bounds else None
+
+def flag_duplicates(shard, chunk_size=1000):
+    """Point every repeated expense at the first expense with its fingerprint and return how many were flagged"""
+    last_fingerprint, flagged = '', 0
+    while last_fingerprint is not None:
+        conn = sharding.connect_shard(shard)
+        # Each chunk is a fingerprint range, which both tiers' fingerprint
+        # indexes can walk without sorting the tables
+        bound = chunk_bound(conn, last_fingerprint, chunk_size)
+        groups = conn.execute('''
+            SELECT fingerprint, MIN(id) AS first_id FROM (
+                SELECT fingerprint, id FROM expenses
+                WHERE fingerprint > ? AND fingerprint <= COALESCE(?, fingerprint)
+                UNION ALL
+                SELECT fingerprint, id FROM expenses_archive
+                WHERE fingerprint > ? AND fingerprint <= COALESCE(?, fingerprint))
+            GROUP BY fingerprint HAVING COUNT(*) > 1
+        ''', (last_fingerprint, bound, last_fingerprint, bound)).fetchall()
+        for table in TIERS:
+            flagged += conn.executemany(f'''
+                UPDATE {table} SET duplicate_of = ?
+                WHERE fingerprint = ? AND id != ? AND duplicate_of IS NOT ?
+            ''', [(row['first_id'], row['fingerprint'], row['first_id'], row['first_id']) for row in groups]).rowcount
+        conn.commit()
+        conn.close()
+        last_fingerprint = bound
+    return flagged
+
+def scan_shard(shard, chunk_size=1000):
+    """Backfill fingerprints on one shard, then flag its duplicates"""
+    return backfill_fingerprints(shard, chunk_size), flag_duplicates(shard, chunk_size)
+
+def scan(chunk_size=1000):
+    """Scan every shard in parallel and return (fingerprinted, flagged) totals"""
+    results = sharding.map_shards(lambda shard: scan_shard(shard, chunk_size))
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+_scan_thread = None
+_scan_lock = threading.Lock()
+
+def start_background_scan():
+    """Start a scan in a daemon thread, once per process"""
+    global _scan_thread
+    with _scan_lock:
+        if _scan_thread is None:
+            _scan_thread = threading.Thread(target=scan, name='dedup-scan', daemon=True)
+            _scan_thread.start()
+    return _scan_thread
+
+if __name__ == '__main__':
+    fingerprinted, flagged = scan(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
+    print(f"Fingerprinted {fingerprinted} expenses, flagged {flagged} duplicates")
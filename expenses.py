@@ -2,9 +2,147 @@ import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 import database as db
-from datetime import datetime
+from utils import rerun_fragment
+import categorizer
+import session_data
+import reports
+from datetime import datetime, timedelta
 import pandas as pd
 
+def read_expense_csv(uploaded_file):
+    """Read an uploaded expense CSV, returning its rows as a DataFrame and a list of problems
+
+    Nothing is returned unless every row has a readable date and amount
+    and a known category or none.
+    """
+    try:
+        import_df = pd.read_csv(uploaded_file)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        return None, [f"Couldn't read the file: {e}"]
+    import_df.columns = import_df.columns.str.strip().str.lower()
+    missing = [column for column in ['date', 'amount', 'description'] if column not in import_df.columns]
+    if missing:
+        return None, [f"Missing column(s): {', '.join(missing)}"]
+    if 'category' not in import_df.columns:
+        import_df['category'] = None
+
+    dates = pd.to_datetime(import_df['date'], errors='coerce')
+    amounts = pd.to_numeric(import_df['amount'], errors='coerce')
+    known = {category.lower(): category for category in db.EXPENSE_CATEGORIES}
+    categories = import_df['category'].map(
+        lambda category: category if pd.isna(category) else known.get(str(category).strip().lower(), '')
+    ).astype(object)  # An all-empty column reads as float64, which can't take predicted labels
+    problems = []
+    for index, row in import_df.iterrows():
+        # Numbered as in a spreadsheet, where the header is row 1
+        for column, parsed in [('date', dates), ('amount', amounts)]:
+            if pd.isna(row[column]):
+                problems.append(f"Row {index + 2}: missing {column}")
+            elif pd.isna(parsed[index]):
+                problems.append(f"Row {index + 2}: can't read {column} '{row[column]}'")
+        if categories[index] == '':
+            problems.append(f"Row {index + 2}: unknown category '{row['category']}'")
+    if problems:
+        return None, problems
+
+    import_df['category'] = categories
+    import_df['date'] = dates.dt.strftime("%Y-%m-%d")
+    import_df['amount'] = amounts.astype(float)
+    import_df['description'] = import_df['description'].fillna('').astype(str)
+    return import_df, []
+
+@st.fragment
+def show_expense_list(user_id, selected_month):
+    """Show the month's expenses; deleting one reruns only this section"""
+    expenses_df = db.get_expenses(user_id, selected_month)
+    st.subheader("Recent Expenses")
+    if not expenses_df.empty:
+        # Create compact table for expenses
+        for idx, row in expenses_df.sort_values('date', ascending=False).iterrows():
+            with st.container():
+                cols = st.columns([2, 2, 3, 2, 1])
+                with cols[0]:
+                    st.markdown(f'<p class="expense-row">{row["date"].strftime("%Y-%m-%d")}</p>', unsafe_allow_html=True)
+                with cols[1]:
+                    st.markdown(f'<p class="expense-row">{row["category"]}</p>', unsafe_allow_html=True)
+                with cols[2]:
+                    description_text = row["description"] if row["description"] else "-"
+                    if pd.notna(row["duplicate_of"]):
+                        description_text += " ⚠️ possible duplicate"
+                    st.markdown(f'<p class="expense-row">{description_text}</p>', unsafe_allow_html=True)
+                with cols[3]:
+                    st.markdown(f'<p class="expense-row">${row["amount"]:,.2f}</p>', unsafe_allow_html=True)
+                with cols[4]:
+                    if st.button("×", key=f"delete_expense_{row['id']}", help="Delete expense"):
+                        db.delete_expense(row['id'], user_id)
+                        st.session_state.delete_success = True
+                        rerun_fragment()
+
+        if st.session_state.delete_success:
+            st.success("Expense deleted")
+            st.session_state.delete_success = None
+    else:
+        st.info("No expenses recorded for this month.")
+
+@st.fragment
+def show_budget_settings():
+    """Show the budget form and current budgets; changes rerun only this section"""
+    data = session_data.get_user_data()
+    col1, col2 = st.columns([1, 1])
+
+    # Add new budget form
+    with col1:
+        with st.form("set_budget"):
+            st.subheader("Set Monthly Budget")
+            budget_category = st.selectbox(
+                "Category",
+                db.EXPENSE_CATEGORIES,
+                key="budget_category"
+            )
+            budget_amount = st.number_input("Budget Amount", min_value=0.0, format="%.2f", key="budget_amount")
+            budget_submitted = st.form_submit_button("Set Budget")
+
+            if budget_submitted:
+                data.set_budget(budget_category, budget_amount)
+                st.session_state.budget_success = True
+                rerun_fragment()
+
+        # Display budget success message
+        if st.session_state.budget_success:
+            st.success(f"Budget set for {budget_category}!")
+            st.session_state.budget_success = None
+
+        with st.form("alert_phone"):
+            st.subheader("Budget Alerts")
+            st.caption("Get a text when a category reaches 80% and 100% of this month's budget.")
+            contact = db.get_user_contact(data.user_id) or {}
+            phone = st.text_input("Phone number", value=contact.get('phone') or "", placeholder="+15551234567")
+            if st.form_submit_button("Save"):
+                db.set_user_phone(data.user_id, phone.strip() or None)
+                st.success("Alert number saved")
+
+    # Display existing budgets
+    with col2:
+        st.subheader("Current Budget Settings")
+        budget_df = data.budget_frame()
+
+        if not budget_df.empty:
+            for _, row in budget_df.iterrows():
+                with st.container():
+                    cols = st.columns([2, 2, 1])
+                    with cols[0]:
+                        st.write(row['category'])
+                    with cols[1]:
+                        st.write(f"${row['amount']:,.2f}")
+                    with cols[2]:
+                        if st.button("🗑️", key=f"delete_{row['category']}"):
+                            data.delete_budget(row['category'])
+                            st.success(f"Deleted budget for {row['category']}")
+                            rerun_fragment()
+                    st.divider()
+        else:
+            st.info("No budgets set yet.")
+
 def show_expenses_page():
     st.header("Monthly Expenses")
     user_id = st.session_state.user['id']
@@ -59,7 +197,7 @@ def show_expenses_page():
     """, unsafe_allow_html=True)
 
     # Tabs for different sections
-    tab1, tab2, tab3 = st.tabs(["Add Expense", "Set Budget", "Analysis"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Add Expense", "Set Budget", "Analysis", "Search", "Reports"])
 
     # Add Expense Tab
     with tab1:
@@ -67,11 +205,11 @@ def show_expenses_page():
             st.subheader("Add New Expense")
             category = st.selectbox(
                 "Category",
-                ["Housing", "Utilities", "Transportation", "Food", "Restaurants",  "Insurance", "Entertainment",
-                 "Shopping & Personal Care", "Household Supplies", "Vacations", "Hobby", "Miscellaneous"]
+                ["Auto-detect"] + db.EXPENSE_CATEGORIES
             )
             amount = st.number_input("Amount", min_value=0.0, format="%.2f")
             description = st.text_input("Description")
+            allow_duplicate = st.checkbox("Add even if it looks like a duplicate")
             submitted = st.form_submit_button("Add Expense")
 
             if submitted:
@@ -79,102 +217,73 @@ def show_expenses_page():
                 expense_date = datetime.strptime(selected_month + "-01", "%Y-%m-%d").replace(
                     day=datetime.today().day
                 ).date()
-                db.add_expense(user_id, category, amount, expense_date, description)
-                st.session_state.expense_success = True
-                st.rerun()
+                # Only categories the user picked teach the categorizer; learning
+                # its own guesses would reinforce them whether right or wrong
+                chosen = category != "Auto-detect"
+                if not chosen:
+                    category = categorizer.classify(user_id, [description])[0]
+                    if category not in db.EXPENSE_CATEGORIES:
+                        category = "Miscellaneous"
+                if db.add_expense(user_id, category, amount, expense_date, description, allow_duplicate):
+                    if chosen:
+                        categorizer.learn(user_id, category, description)
+                    st.session_state.expense_success = True
+                    st.rerun()
+                else:
+                    st.warning("An identical expense already exists. Check the box to add it anyway.")
 
         # Display expense success message
         if st.session_state.expense_success:
             st.success("Expense added successfully!")
             st.session_state.expense_success = None
 
+        with st.expander("Import Expenses from CSV", expanded=False):
+            st.caption("Columns: date, amount, description and optionally category. "
+                       "Rows without a category are categorized automatically.")
+            uploaded_file = st.file_uploader("CSV file", type="csv")
+            if uploaded_file is not None and st.button("Import"):
+                import_df, problems = read_expense_csv(uploaded_file)
+                if problems:
+                    shown = problems[:10]
+                    if len(problems) > len(shown):
+                        shown.append(f"...and {len(problems) - len(shown)} more")
+                    st.error("Nothing was imported:\n\n" + "\n".join(f"- {problem}" for problem in shown))
+                else:
+                    missing = import_df['category'].isna()
+                    if missing.any():
+                        predicted = categorizer.classify(user_id, import_df.loc[missing, 'description'].tolist())
+                        import_df.loc[missing, 'category'] = [c if c in db.EXPENSE_CATEGORIES else "Miscellaneous"
+                                                              for c in predicted]
+
+                    rows = list(import_df[['category', 'amount', 'date', 'description']].itertuples(index=False, name=None))
+                    duplicates = db.add_expenses(user_id, rows)
+                    duplicate_set = set(duplicates)
+                    # Learn from the categories the file gave, not the predicted ones
+                    categorizer.learn_many(user_id, [(row[0], row[3]) for row, predicted in zip(rows, missing)
+                                                     if not predicted and row not in duplicate_set])
+                    st.success(f"Imported {len(rows) - len(duplicates)} expenses")
+                    if duplicates:
+                        st.warning(f"Skipped {len(duplicates)} duplicate expenses")
+
         # Show Recent Expenses right after the add expense form
-        expenses_df = db.get_expenses(user_id, selected_month)
-        st.subheader("Recent Expenses")
-        if not expenses_df.empty:
-            # Create compact table for expenses
-            for idx, row in expenses_df.sort_values('date', ascending=False).iterrows():
-                with st.container():
-                    cols = st.columns([2, 2, 3, 2, 1])
-                    with cols[0]:
-                        st.markdown(f'<p class="expense-row">{pd.to_datetime(row["date"]).strftime("%Y-%m-%d")}</p>', unsafe_allow_html=True)
-                    with cols[1]:
-                        st.markdown(f'<p class="expense-row">{row["category"]}</p>', unsafe_allow_html=True)
-                    with cols[2]:
-                        st.markdown(f'<p class="expense-row">{row["description"] if row["description"] else "-"}</p>', unsafe_allow_html=True)
-                    with cols[3]:
-                        st.markdown(f'<p class="expense-row">${row["amount"]:,.2f}</p>', unsafe_allow_html=True)
-                    with cols[4]:
-                        if st.button("×", key=f"delete_expense_{row['id']}", help="Delete expense"):
-                            db.delete_expense(row['id'], user_id)
-                            st.session_state.delete_success = True
-                            st.rerun()
-
-            if st.session_state.delete_success:
-                st.success("Expense deleted")
-                st.session_state.delete_success = None
-        else:
-            st.info("No expenses recorded for this month.")
+        show_expense_list(user_id, selected_month)
 
     # Set Budget Tab
     with tab2:
-        col1, col2 = st.columns([1, 1])
-
-        # Add new budget form
-        with col1:
-            with st.form("set_budget"):
-                st.subheader("Set Monthly Budget")
-                budget_category = st.selectbox(
-                    "Category",
-                    ["Housing", "Utilities", "Transportation", "Food", "Restaurants", "Insurance", "Entertainment",
-                     "Shopping & Personal Care", "Household Supplies", "Vacations", "Hobby", "Miscellaneous"],
-                    key="budget_category"
-                )
-                budget_amount = st.number_input("Budget Amount", min_value=0.0, format="%.2f", key="budget_amount")
-                budget_submitted = st.form_submit_button("Set Budget")
-
-                if budget_submitted:
-                    db.set_budget(user_id, budget_category, budget_amount)
-                    st.session_state.budget_success = True
-                    st.rerun()
-
-            # Display budget success message
-            if st.session_state.budget_success:
-                st.success(f"Budget set for {budget_category}!")
-                st.session_state.budget_success = None
-
-        # Display existing budgets
-        with col2:
-            st.subheader("Current Budget Settings")
-            budget_df = db.get_budget(user_id)
-
-            if not budget_df.empty:
-                for _, row in budget_df.iterrows():
-                    with st.container():
-                        cols = st.columns([2, 2, 1])
-                        with cols[0]:
-                            st.write(row['category'])
-                        with cols[1]:
-                            st.write(f"${row['amount']:,.2f}")
-                        with cols[2]:
-                            if st.button("🗑️", key=f"delete_{row['category']}"):
-                                db.delete_budget(user_id, row['category'])
-                                st.success(f"Deleted budget for {row['category']}")
-                                st.rerun()
-                        st.divider()
-            else:
-                st.info("No budgets set yet.")
+        show_budget_settings()
 
     # Analysis Tab
     with tab3:
         expenses_df = db.get_expenses(user_id, selected_month)
-        budget_df = db.get_budget(user_id)
+        budget_df = session_data.get_user_data().budget_frame()
 
         if not expenses_df.empty or not budget_df.empty:
             st.subheader("Monthly Budget vs Actual Expenses")
 
             # Prepare data for comparison
-            categories = ["Housing", "Transportation", "Food", "Utilities", "Entertainment", "Other"]
+            # The standard categories, then any other category in use
+            used = set(expenses_df['category']) | set(budget_df['category'])
+            categories = db.EXPENSE_CATEGORIES + sorted(used - set(db.EXPENSE_CATEGORIES))
             expense_by_category = expenses_df.groupby('category')['amount'].sum().reindex(categories).fillna(0)
             budget_by_category = budget_df.set_index('category')['amount'].reindex(categories).fillna(0)
 
@@ -209,4 +318,88 @@ def show_expenses_page():
                     delta=f"${remaining:,.2f}"
                 )
         else:
-            st.info("No expenses or budget set yet.")
\ No newline at end of file
+            st.info("No expenses or budget set yet.")
+
+    # Search Tab
+    with tab4:
+        search_text = st.text_input("Search expenses", placeholder="e.g. coffee, rent, Food")
+
+        if search_text:
+            totals_df = db.get_search_totals(user_id, search_text)
+
+            if not totals_df.empty:
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("Total Spent", f"${totals_df['amount'].sum():,.2f}")
+                with col2:
+                    st.metric("Matching Expenses", int(totals_df['count'].sum()))
+
+                fig = px.bar(
+                    totals_df,
+                    x='month',
+                    y='amount',
+                    color='category',
+                    title=f'Spending matching "{search_text}" by Month'
+                )
+                st.plotly_chart(fig, use_container_width=True)
+
+                st.subheader("Best Matches")
+                matches_df = db.search_expenses(user_id, search_text)
+                st.dataframe(
+                    matches_df[['date', 'category', 'description', 'amount']],
+                    hide_index=True,
+                    use_container_width=True
+                )
+            else:
+                st.info("No expenses match your search.")
+
+    # Reports Tab
+    with tab5:
+        col1, col2 = st.columns(2)
+        with col1:
+            report_start = st.date_input("From", value=current_date.date().replace(month=1, day=1))
+        with col2:
+            report_end = st.date_input("To", value=current_date.date())
+
+        if report_start <= report_end:
+            start, end = report_start.isoformat(), (report_end + timedelta(days=1)).isoformat()
+            summary_df = pd.DataFrame(list(reports.iter_summary_rows(user_id, start, end)),
+                                      columns=reports.SUMMARY_COLUMNS)
+
+            if not summary_df.empty:
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("Total Spent", f"${summary_df['spent'].sum():,.2f}")
+                with col2:
+                    st.metric("Total Budget", f"${summary_df['budget'].sum():,.2f}")
+                st.dataframe(summary_df, hide_index=True, use_container_width=True)
+
+                # Files are generated only when a button is clicked
+                file_stem = f"expenses-{start}-to-{report_end.isoformat()}"
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.download_button(
+                        "Summary (CSV)",
+                        data=lambda: ''.join(reports.summary_csv(user_id, start, end)),
+                        file_name=f"{file_stem}-summary.csv",
+                        mime="text/csv"
+                    )
+                with col2:
+                    st.download_button(
+                        "Monthly Detail (CSV)",
+                        data=lambda: ''.join(reports.monthly_csv(user_id, start, end)),
+                        file_name=f"{file_stem}-monthly.csv",
+                        mime="text/csv"
+                    )
+                with col3:
+                    if reports.openpyxl is not None:
+                        st.download_button(
+                            "Full Report (XLSX)",
+                            data=lambda: reports.xlsx_bytes(user_id, start, end),
+                            file_name=f"{file_stem}.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        )
+            else:
+                st.info("No expenses or budget in this period.")
+        else:
+            st.warning("The start date must be on or before the end date.")
@@ -1,42 +1,60 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 from utils import calculate_percentage
 import database as db
+import sharding
+import session_data
+import currency
 
-def calculate_savings_score(buckets_df):
-    """Calculate score based on savings and investment allocation"""
-    total_amount = buckets_df['amount'].sum()
-    if total_amount == 0:
-        return 0
+BUCKET_TYPES = db.BUCKET_TYPES
+INVESTMENT_TYPES = ["RRSP", "TFSA"]
+SCORE_WEIGHTS = {
+    'savings': 0.4,
+    'diversification': 0.3,
+    'budget': 0.3
+}
 
-    # Calculate percentage in investment accounts (RRSP, TFSA)
-    investment_amount = buckets_df[buckets_df['type'].isin(['RRSP', 'TFSA'])]['amount'].sum()
-    investment_ratio = investment_amount / total_amount
+def type_allocation(buckets_df):
+    """Total bucket amounts per type
 
-    # Score from 0-100 based on investment ratio (target: 40%+ in investments)
-    savings_score = min(100, (investment_ratio / 0.4) * 100)
-    return savings_score
+    Returns the types (BUCKET_TYPES first), the amount held in each and
+    whether the user has a bucket of that type at all.
+    """
+    totals = buckets_df.groupby('type', observed=True)['amount'].sum()
+    types = BUCKET_TYPES + sorted(set(totals.index) - set(BUCKET_TYPES))
+    present = np.isin(types, totals.index)
+    return types, totals.reindex(types).fillna(0).to_numpy(dtype='float64'), present
 
-def calculate_diversification_score(buckets_df):
-    """Calculate score based on portfolio diversification"""
-    if buckets_df.empty:
-        return 0
-
-    total_amount = buckets_df['amount'].sum()
-    if total_amount == 0:
-        return 0
-
-    # Calculate concentration in each type
-    type_concentrations = (buckets_df.groupby('type')['amount'].sum() / total_amount)
+def savings_scores(allocations, types):
+    """Score each row of an allocation matrix (one column per type) on its investment ratio"""
+    totals = allocations.sum(axis=1)
+    investment = allocations[:, np.isin(types, INVESTMENT_TYPES)].sum(axis=1)
+    # Score from 0-100 based on investment ratio (target: 40%+ in investments)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.minimum(100, investment / totals / 0.4 * 100)
+    return np.where(totals == 0, 0, scores)
 
+def diversification_scores(allocations, present):
+    """Score each row of an allocation matrix on its spread across types"""
+    totals = allocations.sum(axis=1)
     # Penalize if any single type is over 50% of portfolio
-    max_concentration = type_concentrations.max()
-    diversification_score = 100 - max(0, ((max_concentration - 0.5) * 200))
-
+    with np.errstate(divide='ignore', invalid='ignore'):
+        max_concentration = allocations.max(axis=1) / totals
+    scores = 100 - np.maximum(0, (max_concentration - 0.5) * 200)
     # Bonus for having multiple types
-    type_count_bonus = min(20, len(type_concentrations) * 5)
+    type_count_bonus = np.minimum(20, present.sum(axis=1) * 5)
+    return np.where(totals == 0, 0, np.minimum(100, scores + type_count_bonus))
+
+def calculate_savings_score(buckets_df):
+    """Calculate score based on savings and investment allocation"""
+    types, allocation, _ = type_allocation(buckets_df)
+    return float(savings_scores(allocation[np.newaxis], types)[0])
 
-    return min(100, diversification_score + type_count_bonus)
+def calculate_diversification_score(buckets_df):
+    """Calculate score based on portfolio diversification"""
+    _, allocation, present = type_allocation(buckets_df)
+    return float(diversification_scores(allocation[np.newaxis], present[np.newaxis])[0])
 
 def calculate_budget_score(expenses_df, budget_df):
     """Calculate score based on budget adherence"""
@@ -77,17 +95,19 @@ def get_health_score(user_id):
     expenses_df = db.get_expenses(user_id, current_month)
     budget_df = db.get_budget(user_id)  
 
+    return calculate_health_score(buckets_df, expenses_df, budget_df)
+
+def calculate_health_score(buckets_df, expenses_df, budget_df):
+    """Calculate overall financial health score from a user's data"""
+    buckets_df = currency.convert_frame(buckets_df)
+
     # Calculate individual scores
     savings_score = calculate_savings_score(buckets_df)
     diversification_score = calculate_diversification_score(buckets_df)
     budget_score = calculate_budget_score(expenses_df, budget_df)
 
-    # Calculate weighted average (adjust weights as needed)
-    weights = {
-        'savings': 0.4,
-        'diversification': 0.3,
-        'budget': 0.3
-    }
+    # Calculate weighted average (adjust SCORE_WEIGHTS as needed)
+    weights = SCORE_WEIGHTS
 
     overall_score = (
         savings_score * weights['savings'] +
@@ -102,6 +122,17 @@ def get_health_score(user_id):
         'budget_score': round(budget_score, 1)
     }
 
+def get_shard_health_scores(shard):
+    """Calculate health scores for every user stored on one shard"""
+    return {user_id: get_health_score(user_id) for user_id in db.get_user_ids(shard)}
+
+def get_all_health_scores():
+    """Calculate health scores for all users, scoring shards in parallel"""
+    scores = {}
+    for shard_scores in sharding.map_shards(get_shard_health_scores):
+        scores.update(shard_scores)
+    return scores
+
 def get_recommendations(scores):
     """Generate recommendations based on scores"""
     recommendations = []
@@ -120,12 +151,87 @@ def get_recommendations(scores):
 
     return recommendations
 
+def single_moves(allocation, fractions):
+    """Build every move of a fraction of one type's money into another type
+
+    Returns the change each move makes to the allocation, one row per move,
+    and the source index, destination index and amount of each move. Row 0
+    is all zeros and stands for making no move.
+    """
+    count = len(allocation)
+    src, dst, frac = np.meshgrid(np.arange(count), np.arange(count), fractions, indexing='ij')
+    keep = (src != dst) & (allocation[src] > 0)
+    src, dst, frac = src[keep], dst[keep], frac[keep]
+    amounts = allocation[src] * frac
+    deltas = np.zeros((len(amounts) + 1, count))
+    rows = np.arange(1, len(amounts) + 1)
+    deltas[rows, src] -= amounts
+    deltas[rows, dst] += amounts
+    return deltas, np.r_[-1, src], np.r_[-1, dst], np.r_[0, amounts]
+
+def simulate_reallocations(buckets_df, fractions=np.linspace(0.05, 1.0, 20), top=3):
+    """Find the reallocations between bucket types that raise the health score the most
+
+    Candidates are every pair of single moves, so up to two transfers, and
+    are all scored in one NumPy pass. Returns up to `top` dicts with the
+    transfers as (from_type, to_type, amount) and the overall score gain.
+    """
+    types, allocation, present = type_allocation(buckets_df)
+    if allocation.sum() <= 0:
+        return []
+
+    deltas, src, dst, amounts = single_moves(allocation, fractions)
+    # Pair every move with every later one; pairing with row 0 keeps the single moves
+    first = np.repeat(np.arange(len(deltas)), len(deltas))
+    second = np.tile(np.arange(len(deltas)), len(deltas))
+    candidates = allocation + deltas[first] + deltas[second]
+    # Two moves out of one type can together take more than it holds, and
+    # moving money back where it came from is never the best advice
+    keep = (
+        (first < second)
+        & (candidates > -1e-6).all(axis=1)
+        & ~((src[first] == dst[second]) & (dst[first] == src[second]))
+    )
+    first, second, candidates = first[keep], second[keep], np.maximum(candidates[keep], 0)
+
+    base_savings = savings_scores(allocation[np.newaxis], types)
+    base_diversification = diversification_scores(allocation[np.newaxis], present[np.newaxis])
+    gains = (
+        SCORE_WEIGHTS['savings'] * (savings_scores(candidates, types) - base_savings)
+        + SCORE_WEIGHTS['diversification'] * (
+            diversification_scores(candidates, present | (candidates > 1e-6)) - base_diversification)
+    )
+
+    # Biggest gain first, then the least money moved, then the fewest transfers
+    moved = amounts[first] + amounts[second]
+    best, seen = [], set()
+    for index in np.lexsort((first > 0, moved.round(2), -gains.round(1))):
+        if gains[index] < 0.1 or len(best) == top:
+            break
+        # Different pairs of moves can land on the same allocation
+        outcome = tuple(candidates[index].round(2))
+        if outcome in seen:
+            continue
+        seen.add(outcome)
+        best.append({
+            'transfers': [(types[src[i]], types[dst[i]], float(amounts[i]))
+                          for i in (first[index], second[index]) if i],
+            'gain': round(float(gains[index]), 1),
+        })
+    return best
+
 def show_health_score_page():
     """Display the financial health score dashboard"""
     st.header("Financial Health Score")
 
     user_id = st.session_state.user['id']
-    scores = get_health_score(user_id)
+    data = session_data.get_user_data()
+    current_month = pd.Timestamp.now().strftime('%Y-%m')
+    scores = calculate_health_score(
+        data.buckets_frame(),
+        db.get_expenses(user_id, current_month),
+        data.budget_frame()
+    )
 
     # Display overall score
     st.metric("Overall Financial Health Score", f"{scores['overall_score']}/100")
@@ -143,4 +249,15 @@ def show_health_score_page():
     st.subheader("Recommendations")
     recommendations = get_recommendations(scores)
     for rec in recommendations:
-        st.write("•", rec)
\ No newline at end of file
+        st.write("•", rec)
+
+    # Best reallocations between bucket types, amounts in the base currency
+    moves = simulate_reallocations(currency.convert_frame(data.buckets_frame()))
+    if moves:
+        st.subheader("Best Moves")
+        for move in moves:
+            steps = " and ".join(
+                f"move ${amount:,.2f} from {from_type} to {to_type}"
+                for from_type, to_type, amount in move['transfers']
+            )
+            st.write("•", f"{steps[0].upper()}{steps[1:]} to raise your score by {move['gain']} points")
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""Drive concurrent headless sessions through the app and report rerun latency.
+
+Each simulated session is logged in by setting st.session_state.user
+directly, so Auth0 is never contacted. Sessions click through the pages
+against a freshly seeded database, mixing reads with writes. AppTest keeps
+a process-wide runtime, so each session runs in its own worker process.
+
+Usage: python loadtest.py [--sessions 1 2 4 8] [--steps 20] [--write-ratio 0.2]
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+# auth.py reads these at import time; a stubbed login never uses them
+for name in ('AUTH0_CLIENT_ID', 'AUTH0_CLIENT_SECRET', 'AUTH0_DOMAIN'):
+    os.environ.setdefault(name, 'loadtest')
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+PAGES = ["Overview", "Money Buckets", "Monthly Expenses", "Financial Goals", "Financial Health Score"]
+CATEGORIES = ["Housing", "Utilities", "Transportation", "Food", "Restaurants", "Entertainment"]
+
+def seed_users(count, expenses_per_user):
+    """Create users with buckets, a year of expenses, budgets and goals"""
+    import database as db
+    conn = db.get_db_connection()
+    users = []
+    for i in range(count):
+        cursor = conn.execute(
+            'INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)',
+            (f"load{i}", '', f"load{i}@example.com")
+        )
+        users.append({'id': cursor.lastrowid, 'username': f"load{i}"})
+    conn.commit()
+    conn.close()
+
+    today = date.today()
+    for user in users:
+        user_id = user['id']
+        for bucket_type in ["RRSP", "TFSA", "Cash", "Crypto", "Non-Registered"]:
+            db.add_bucket(user_id, f"My {bucket_type}", random.uniform(500, 20000), bucket_type)
+        db.add_expenses(user_id, [
+            (random.choice(CATEGORIES), round(random.uniform(5, 300), 2),
+             today - timedelta(days=random.randrange(365)), f"seed expense {n}")
+            for n in range(expenses_per_user)
+        ])
+        for category in CATEGORIES:
+            db.set_budget(user_id, category, random.uniform(100, 1500))
+        bucket_ids = db.get_buckets(user_id)['id'].tolist()
+        for n in range(2):
+            goal_id = db.add_goal(user_id, f"Goal {n}", 10000, today + timedelta(days=365), "Savings")
+            db.link_goal_to_buckets(goal_id, random.sample(bucket_ids, 2), user_id)
+    return users
+
+def write_action(at, page, rng):
+    """Perform one write on the current page; return False if the page has none"""
+    if page == "Money Buckets":
+        inputs = [w for w in at.number_input if w.key and w.key.startswith('bucket_')]
+        if inputs:
+            widget = rng.choice(inputs)
+            widget.set_value(round(widget.value + rng.uniform(-50, 50), 2))
+            return True
+    elif page == "Monthly Expenses":
+        amount = next(w for w in at.number_input if w.label == "Amount")
+        description = next(w for w in at.text_input if w.label == "Description")
+        amount.set_value(round(rng.uniform(5, 100), 2))
+        description.set_value(f"load expense {rng.random()}")
+        next(b for b in at.button if b.label == "Add Expense").click()
+        return True
+    return False
+
+def run_session(user, steps, write_ratio, seed):
+    """Click through random pages as one user and return (latencies, errors, started, finished)"""
+    from streamlit.testing.v1 import AppTest
+    logging.getLogger('streamlit').setLevel(logging.CRITICAL)
+    rng = random.Random(seed)
+    latencies, errors = [], []
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.session_state.user = user
+    at.run()
+    started = time.time()
+    for _ in range(steps):
+        page = rng.choice(PAGES)
+        at.sidebar.radio[0].set_value(page)
+        timed_run(at, latencies, errors)
+        if rng.random() < write_ratio and write_action(at, page, rng):
+            timed_run(at, latencies, errors)
+    return latencies, errors, started, time.time()
+
+def timed_run(at, latencies, errors):
+    start = time.perf_counter()
+    at.run()
+    latencies.append(time.perf_counter() - start)
+    errors.extend(str(e.value) for e in at.exception)
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def run_level(users, session_count, steps, write_ratio):
+    """Run session_count concurrent sessions and return (latencies, errors, elapsed)"""
+    with ProcessPoolExecutor(max_workers=session_count) as executor:
+        results = list(executor.map(
+            run_session,
+            [users[i % len(users)] for i in range(session_count)],
+            [steps] * session_count,
+            [write_ratio] * session_count,
+            range(session_count),
+        ))
+    latencies = [latency for result in results for latency in result[0]]
+    errors = [error for result in results for error in result[1]]
+    # Measure from the first session starting to click to the last one finishing,
+    # leaving out worker start-up
+    elapsed = max(result[3] for result in results) - min(result[2] for result in results)
+    return latencies, errors, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--steps', type=int, default=20, help="reruns per session")
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--expenses', type=int, default=1000, help="seeded expenses per user")
+    parser.add_argument('--degraded', type=float, default=2.0,
+                        help="report degradation once p90 latency exceeds this multiple of the first level's")
+    args = parser.parse_args()
+
+    # App exceptions are collected and summarized per level instead
+    logging.getLogger('streamlit').setLevel(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Point the app at a scratch database before anything imports database.py
+        os.environ['FINANCE_DB_PATH'] = os.path.join(tmpdir, 'loadtest.db')
+        users = seed_users(args.users, args.expenses)
+
+        print(f"{'sessions':>8} {'reruns':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'reruns/s':>9}")
+        baseline_p90, degraded_at = None, None
+        for session_count in args.sessions:
+            latencies, errors, elapsed = run_level(users, session_count, args.steps, args.write_ratio)
+            p90 = percentile(latencies, 90)
+            print(f"{session_count:>8} {len(latencies):>7} {percentile(latencies, 50) * 1000:>8.0f} "
+                  f"{p90 * 1000:>8.0f} {percentile(latencies, 99) * 1000:>8.0f} {len(latencies) / elapsed:>9.1f}")
+            for error in set(errors):
+                print(f"         error: {error}")
+            baseline_p90 = baseline_p90 or p90
+            if degraded_at is None and p90 > baseline_p90 * args.degraded:
+                degraded_at = session_count
+
+        if degraded_at:
+            print(f"\np90 latency passed {args.degraded}x the single-level baseline at {degraded_at} sessions")
+        else:
+            print(f"\np90 latency stayed within {args.degraded}x of the baseline at every level")
+
+if __name__ == '__main__':
+    main()
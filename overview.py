@@ -0,0 +1,92 @@
+import streamlit as st
+import pandas as pd
+import database as db
+import session_data
+import currency
+import financial_health
+from utils import format_currency
+
+def compute_summary(data, month):
+    """Compute a user's overview figures for a YYYY-MM month from their session data"""
+    buckets_df = currency.convert_frame(data.buckets_frame())
+    spent = db.get_month_totals(data.user_id, month)
+    budgets = {budget.category: budget.amount for budget in data.budgets.values()}
+    current = {goal_id: data.goal_current_amount(goal_id) for goal_id in data.goals}
+    return {
+        'month': month,
+        'net_worth': float(buckets_df['amount'].fillna(0).sum()),
+        'month_spent': float(sum(spent.values())),
+        'month_budget': float(sum(budgets.values())),
+        'budget_points': float(sum(db.budget_points(spent.get(category, 0.0), amount)
+                                   for category, amount in budgets.items())),
+        'savings_score': float(financial_health.calculate_savings_score(buckets_df)),
+        'diversification_score': float(financial_health.calculate_diversification_score(buckets_df)),
+        'goal_count': len(data.goals),
+        'goals_reached': sum(current[goal_id] >= goal.target_amount for goal_id, goal in data.goals.items()),
+        'goal_saved': float(sum(min(current[goal_id], goal.target_amount) for goal_id, goal in data.goals.items())),
+        'goal_target': float(sum(goal.target_amount for goal in data.goals.values())),
+    }
+
+@session_data.on_refresh
+def refresh_summary(data):
+    """Recompute and store a user's summary after a write to their buckets, budget or goals"""
+    summary = compute_summary(data, pd.Timestamp.now().strftime('%Y-%m'))
+    db.save_user_summary(data.user_id, data.version, summary)
+    return summary
+
+def get_summary(user_id):
+    """Get a user's stored summary, recomputing it only if it is from another month or data version"""
+    summary = db.get_user_summary(user_id)
+    if (summary is None or summary['month'] != pd.Timestamp.now().strftime('%Y-%m')
+            or summary['version'] != summary['current_version']):
+        summary = refresh_summary(session_data.get_user_data())
+    return summary
+
+def health_scores(summary):
+    """Combine a summary's component scores the way financial_health.calculate_health_score does"""
+    budget_score = summary['budget_points'] / summary['month_budget'] if summary['month_budget'] > 0 else 0
+    weights = financial_health.SCORE_WEIGHTS
+    overall_score = (
+        summary['savings_score'] * weights['savings'] +
+        summary['diversification_score'] * weights['diversification'] +
+        budget_score * weights['budget']
+    )
+    return {
+        'overall_score': round(overall_score, 1),
+        'savings_score': round(summary['savings_score'], 1),
+        'diversification_score': round(summary['diversification_score'], 1),
+        'budget_score': round(budget_score, 1)
+    }
+
+def show_overview_page():
+    """Display the user's net worth, spending, goals and health score from their summary"""
+    st.header("Overview")
+
+    summary = get_summary(st.session_state.user['id'])
+    scores = health_scores(summary)
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(f"Net Worth ({currency.BASE_CURRENCY})", format_currency(summary['net_worth']))
+    with col2:
+        st.metric("Spent This Month", format_currency(summary['month_spent']))
+    with col3:
+        st.metric("Goals Reached", f"{summary['goals_reached']}/{summary['goal_count']}")
+    with col4:
+        st.metric("Financial Health Score", f"{scores['overall_score']}/100")
+
+    st.subheader("This Month's Budget")
+    if summary['month_budget'] > 0:
+        used = summary['month_spent'] / summary['month_budget']
+        st.progress(min(used, 1.0), text=f"{format_currency(summary['month_spent'])} of "
+                                          f"{format_currency(summary['month_budget'])} ({used:.0%})")
+    else:
+        st.info("No budget set yet. Set one on the Monthly Expenses page.")
+
+    st.subheader("Goal Progress")
+    if summary['goal_target'] > 0:
+        saved = summary['goal_saved'] / summary['goal_target']
+        st.progress(min(saved, 1.0), text=f"{format_currency(summary['goal_saved'])} saved of "
+                                           f"{format_currency(summary['goal_target'])} ({saved:.0%})")
+    else:
+        st.info("No goals yet. Add one on the Financial Goals page.")
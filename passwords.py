@@ -0,0 +1,145 @@
+"""Hash and verify passwords off the Streamlit script threads, with login throttling.
+
+Hashes are stored as scrypt$N$r$p$salt$hash with a random salt per
+password. Older installs stored a bare SHA-256 hex digest; those still
+verify, and verify_password returns a scrypt hash to store in its place.
+Raising FINANCE_SCRYPT_N makes new hashes slower, and older scrypt hashes
+are upgraded the same way on their next successful login.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCRYPT_N = int(os.environ.get('FINANCE_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('FINANCE_SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('FINANCE_SCRYPT_P', 1))
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# Hashing runs on a small pool so a burst of logins queues up there instead
+# of holding every script thread; past MAX_PENDING jobs logins are refused
+KDF_WORKERS = int(os.environ.get('FINANCE_KDF_WORKERS', 2))
+MAX_PENDING = KDF_WORKERS * 8
+
+# After FREE_ATTEMPTS failures a username waits BASE_DELAY seconds before
+# its next attempt, doubling with each further failure up to MAX_DELAY.
+# Failures are forgotten FORGET_AFTER seconds after the last one.
+FREE_ATTEMPTS = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 900.0
+FORGET_AFTER = 3600.0
+
+class LoginThrottled(Exception):
+    """A login attempt was refused before checking the password"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many login attempts, try again in {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+class HashingBusy(LoginThrottled):
+    """The hashing pool was full, so no password was hashed or checked"""
+
+    def __init__(self, retry_after):
+        Exception.__init__(self, f"The server is busy, try again in {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+def scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=HASH_BYTES)
+
+def encode(n, r, p, salt, digest):
+    return '$'.join(['scrypt', str(n), str(r), str(p),
+                     base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+
+def _hash(password):
+    salt = os.urandom(SALT_BYTES)
+    return encode(SCRYPT_N, SCRYPT_R, SCRYPT_P, salt, scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P))
+
+def _verify(password, stored):
+    if re.fullmatch(r'[0-9a-f]{64}', stored or ''):
+        # Legacy unsalted SHA-256; a failure still spends the hashing time,
+        # so it takes as long as a success, which hashes the upgrade
+        ok = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        new_hash = _hash(password)
+        return ok, new_hash if ok else None
+    parts = (stored or '').split('$')
+    if len(parts) != 6 or parts[0] != 'scrypt':
+        # No password set, as for Auth0 users; still spend the hashing time
+        _hash(password)
+        return False, None
+    n, r, p = (int(part) for part in parts[1:4])
+    salt, digest = base64.b64decode(parts[4]), base64.b64decode(parts[5])
+    ok = hmac.compare_digest(scrypt(password, salt, n, r, p), digest)
+    current = (n, r, p) == (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return ok, _hash(password) if ok and not current else None
+
+_executor = ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix='password-kdf')
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+def run(func, *args):
+    """Run a hashing job on the pool and wait for it"""
+    if not _pending.acquire(blocking=False):
+        raise HashingBusy(BASE_DELAY)
+    try:
+        return _executor.submit(func, *args).result()
+    finally:
+        _pending.release()
+
+def hash_password(password):
+    """Hash a password with a new salt and the current scrypt parameters"""
+    return run(_hash, password)
+
+def verify_password(password, stored):
+    """Check a password against a stored hash
+
+    Returns whether it matched and, if the stored hash is legacy SHA-256 or
+    uses old scrypt parameters, a new hash to replace it with.
+    """
+    return run(_verify, password, stored)
+
+# username -> (failures, time of the last failure)
+_failures = {}
+_in_flight = set()
+_throttle_lock = threading.Lock()
+
+def begin_attempt(username):
+    """Reserve a login attempt for a username, raising LoginThrottled if it must wait"""
+    now = time.monotonic()
+    with _throttle_lock:
+        if len(_failures) > 10000:
+            for key, (_, last) in list(_failures.items()):
+                if now - last > FORGET_AFTER:
+                    del _failures[key]
+        # One attempt at a time per username, so parallel guesses can't
+        # all get in before the first failure is counted
+        if username in _in_flight:
+            raise LoginThrottled(BASE_DELAY)
+        failures, last = _failures.get(username, (0, now))
+        if failures >= FREE_ATTEMPTS and now - last < FORGET_AFTER:
+            delay = min(MAX_DELAY, BASE_DELAY * 2 ** (failures - FREE_ATTEMPTS))
+            if now - last < delay:
+                raise LoginThrottled(delay - (now - last))
+        _in_flight.add(username)
+
+def cancel_attempt(username):
+    """Release an attempt reserved with begin_attempt whose password was never checked"""
+    with _throttle_lock:
+        _in_flight.discard(username)
+
+def end_attempt(username, succeeded):
+    """Record the outcome of an attempt reserved with begin_attempt"""
+    now = time.monotonic()
+    with _throttle_lock:
+        _in_flight.discard(username)
+        if succeeded:
+            _failures.pop(username, None)
+        else:
+            failures, last = _failures.get(username, (0, now))
+            if now - last > FORGET_AFTER:
+                failures = 0
+            _failures[username] = (failures + 1, now)
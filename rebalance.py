@@ -0,0 +1,130 @@
+"""Move user data between shards after changing the shard count.
+
+Usage: python rebalance.py OLD_COUNT NEW_COUNT
+
+Run it with the application stopped, then start the application with
+FINANCE_DB_SHARDS set to NEW_COUNT.
+"""
+import sys
+import database as db
+import sharding
+
+# Tables whose ids are referenced by other tables and must be remapped when
+# rows are re-inserted on another shard
+REMAPPED_TABLES = {'buckets': 'bucket_id', 'goals': 'goal_id'}
+
+# Live and archived expenses share one id space, which duplicate_of points
+# into, so they are copied together with ids taken from dst's sequence
+EXPENSE_TABLES = ('expenses', 'expenses_archive')
+
+def get_user_tables(conn):
+    """Get every table holding per-user rows"""
+    tables = []
+    for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name != 'users'"):
+        columns = [col['name'] for col in conn.execute(f'PRAGMA table_info("{row["name"]}")')]
+        if 'user_id' in columns:
+            tables.append((row['name'], columns))
+    return tables
+
+def delete_user_rows(conn, user_id):
+    """Delete every row belonging to a user on one shard"""
+    conn.execute('''
+        DELETE FROM goal_buckets
+        WHERE goal_id IN (SELECT id FROM goals WHERE user_id = ?)
+    ''', (user_id,))
+    for table, _ in get_user_tables(conn):
+        conn.execute(f'DELETE FROM "{table}" WHERE user_id = ?', (user_id,))
+
+def reserve_expense_ids(dst, count):
+    """Take count expense ids unused on dst by either tier and return the first"""
+    row = dst.execute("SELECT seq FROM sqlite_sequence WHERE name = 'expenses'").fetchone()
+    archived = dst.execute('SELECT MAX(id) FROM expenses_archive').fetchone()[0]
+    first = max(row['seq'] if row else 0, archived or 0) + 1
+    if row:
+        dst.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'expenses'", (first + count - 1,))
+    else:
+        dst.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('expenses', ?)", (first + count - 1,))
+    return first
+
+def move_expenses(user_id, src, dst):
+    """Copy a user's live and archived expenses to dst under new ids, keeping duplicate_of links"""
+    rows = []
+    for table in EXPENSE_TABLES:
+        rows.extend((row['id'], table, row) for row in
+                    src.execute(f'SELECT * FROM {table} WHERE user_id = ?', (user_id,)))
+    # New ids keep the old order, so the first of a set of duplicates stays first
+    rows.sort(key=lambda item: item[0])
+    first = reserve_expense_ids(dst, len(rows))
+    id_map = {old_id: first + i for i, (old_id, _, _) in enumerate(rows)}
+    for old_id, table, row in rows:
+        columns = row.keys()
+        values = dict(row, id=id_map[old_id], duplicate_of=id_map.get(row['duplicate_of']))
+        dst.execute(
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})',
+            [values[col] for col in columns]
+        )
+
+def move_user(user_id, src, dst):
+    """Copy a user's rows from src to dst, then remove them from src"""
+    # Clearing dst first makes a rerun after an interrupted move safe
+    delete_user_rows(dst, user_id)
+
+    id_maps = {}
+    move_expenses(user_id, src, dst)
+    for table, columns in get_user_tables(src):
+        if table in EXPENSE_TABLES:
+            continue
+        copied = [col for col in columns if col != 'id']
+        placeholders = ', '.join('?' for _ in copied)
+        column_list = ', '.join(f'"{col}"' for col in copied)
+        id_map = id_maps.setdefault(REMAPPED_TABLES.get(table), {})
+        for row in src.execute(f'SELECT * FROM "{table}" WHERE user_id = ?', (user_id,)):
+            cursor = dst.execute(
+                f'INSERT INTO "{table}" ({column_list}) VALUES ({placeholders})',
+                [row[col] for col in copied]
+            )
+            if table in REMAPPED_TABLES:
+                id_map[row['id']] = cursor.lastrowid
+
+    for row in src.execute('''
+        SELECT gb.goal_id, gb.bucket_id FROM goal_buckets gb
+        JOIN goals g ON g.id = gb.goal_id
+        WHERE g.user_id = ?
+    ''', (user_id,)):
+        bucket_id = id_maps['bucket_id'].get(row['bucket_id'])
+        if bucket_id is not None:
+            dst.execute('INSERT INTO goal_buckets (goal_id, bucket_id) VALUES (?, ?)',
+                        (id_maps['goal_id'][row['goal_id']], bucket_id))
+    dst.commit()
+
+    delete_user_rows(src, user_id)
+    src.commit()
+
+def rebalance(old_count, new_count):
+    """Move every user whose shard changes between old_count and new_count shards"""
+    for path in sharding.all_paths(new_count):
+        conn = sharding.connect_path(path)
+        db.create_schema(conn, directory=path == sharding.DB_PATH)
+        conn.close()
+
+    moved = 0
+    for user_id in db.get_user_ids():
+        src_path = sharding.shard_path(sharding.shard_for_user(user_id, old_count), old_count)
+        dst_path = sharding.shard_path(sharding.shard_for_user(user_id, new_count), new_count)
+        if src_path == dst_path:
+            continue
+        src = sharding.connect_path(src_path)
+        dst = sharding.connect_path(dst_path)
+        try:
+            move_user(user_id, src, dst)
+        finally:
+            src.close()
+            dst.close()
+        moved += 1
+    return moved
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    moved = rebalance(int(sys.argv[1]), int(sys.argv[2]))
+    print(f"Moved {moved} users")
@@ -0,0 +1,119 @@
+"""Build spending reports for a date range from SQL aggregates.
+
+Usage: python reports.py USER_ID START END [--format csv|xlsx] [-o PATH]
+
+START is inclusive and END exclusive, both as YYYY-MM-DD.
+"""
+import argparse
+import csv
+import io
+import sys
+import pandas as pd
+import database as db
+import currency
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+SUMMARY_COLUMNS = ['category', 'spent', 'expenses', 'budget', 'budget_used_pct']
+BUCKET_TOTAL_COLUMNS = ['type', f'amount_{currency.BASE_CURRENCY.lower()}']
+
+def month_count(start, end):
+    """Count the calendar months touched by the range start to end (exclusive)"""
+    last_day = pd.Timestamp(end) - pd.Timedelta(days=1)
+    return max(0, (last_day.to_period('M') - pd.Timestamp(start).to_period('M')).n + 1)
+
+def iter_summary_rows(user_id, start, end):
+    """Yield one row per category totalling spend against the budget for the whole range"""
+    months = month_count(start, end)
+    budgets = dict(zip(*(db.get_budget(user_id)[column] for column in ('category', 'amount'))))
+    totals = {}
+    # Only one entry per category is held, however many months are streamed
+    for month, category, spent, expenses, *_ in db.iter_report_rows(user_id, start, end):
+        total = totals.setdefault(category, [0.0, 0])
+        total[0] += spent
+        total[1] += expenses
+    for category in sorted(set(totals) | set(budgets)):
+        spent, expenses = totals.get(category, (0.0, 0))
+        budget = budgets[category] * months if category in budgets else None
+        used = round(100 * spent / budget, 1) if budget else None
+        yield category, round(spent, 2), expenses, budget, used
+
+def iter_bucket_totals(user_id):
+    """Yield the current total per bucket type in the base currency"""
+    buckets_df = currency.convert_frame(db.get_buckets(user_id))
+    totals = buckets_df.groupby('type', observed=True)['amount'].sum().round(2)
+    yield from totals.items()
+
+def iter_csv(header, rows, chunk_rows=500):
+    """Yield CSV text a chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def monthly_csv(user_id, start, end):
+    """Stream the month-by-category report as CSV text"""
+    return iter_csv(db.REPORT_COLUMNS, db.iter_report_rows(user_id, start, end))
+
+def summary_csv(user_id, start, end):
+    """Stream the per-category summary as CSV text"""
+    return iter_csv(SUMMARY_COLUMNS, iter_summary_rows(user_id, start, end))
+
+def write_xlsx(user_id, start, end, dest):
+    """Write the monthly rows, summary and bucket totals as sheets of an XLSX file
+
+    dest is a path or a binary file object. Needs openpyxl; its write-only
+    mode streams rows to disk instead of building the sheets in memory.
+    """
+    if openpyxl is None:
+        raise RuntimeError("XLSX reports need openpyxl installed")
+    workbook = openpyxl.Workbook(write_only=True)
+    sheets = [
+        ('Monthly', db.REPORT_COLUMNS, db.iter_report_rows(user_id, start, end)),
+        ('Summary', SUMMARY_COLUMNS, iter_summary_rows(user_id, start, end)),
+        ('Buckets', BUCKET_TOTAL_COLUMNS, iter_bucket_totals(user_id)),
+    ]
+    for title, header, rows in sheets:
+        sheet = workbook.create_sheet(title)
+        sheet.append(header)
+        for row in rows:
+            sheet.append(list(row))
+    workbook.save(dest)
+
+def xlsx_bytes(user_id, start, end):
+    """Build the XLSX report in memory for a download"""
+    buffer = io.BytesIO()
+    write_xlsx(user_id, start, end, buffer)
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('user_id', type=int)
+    parser.add_argument('start')
+    parser.add_argument('end')
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+    parser.add_argument('-o', '--output', help="file to write, default stdout for CSV")
+    args = parser.parse_args()
+
+    if args.format == 'xlsx':
+        write_xlsx(args.user_id, args.start, args.end, args.output or f"report-{args.user_id}.xlsx")
+        return
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for chunk in monthly_csv(args.user_id, args.start, args.end):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Migrate a copy of a database with init_db() and check the resulting schema.
+
+Usage: python schema_check.py [DB_PATH]
+
+DB_PATH defaults to finance.db, which ships with the baseline schema. The
+original file is never changed. Exits non-zero if the migrated copy fails
+PRAGMA foreign_key_check or still names a *_legacy table anywhere.
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import sharding
+
+def schema_problems(path):
+    """List what is wrong with a migrated database's schema"""
+    conn = sqlite3.connect(path)
+    problems = [f"foreign_key_check: {row}" for row in conn.execute('PRAGMA foreign_key_check')]
+    problems += [f"{kind} {name} mentions a _legacy table" for kind, name in conn.execute('''
+        SELECT type, name FROM sqlite_master
+        WHERE name LIKE '%\\_legacy%' ESCAPE '\\' OR sql LIKE '%\\_legacy%' ESCAPE '\\'
+    ''')]
+    conn.close()
+    return problems
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else 'finance.db'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Importing database.py runs init_db() on sharding.DB_PATH
+        sharding.DB_PATH = os.path.join(tmpdir, os.path.basename(source))
+        shutil.copy(source, sharding.DB_PATH)
+        import database  # noqa: F401
+        problems = schema_problems(sharding.DB_PATH)
+    for problem in problems:
+        print(problem)
+    print(f"{source}: {'FAILED' if problems else 'ok'}")
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import copy
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+import database as db
+import categorizer
+import currency
+
+logger = logging.getLogger(__name__)
+
+class Bucket:
+    __slots__ = ('id', 'name', 'amount', 'type', 'currency')
+
+    def __init__(self, id, name, amount, type, currency):
+        self.id = id
+        self.name = name
+        self.amount = amount
+        self.type = type
+        self.currency = currency
+
+class Budget:
+    __slots__ = ('category', 'amount')
+
+    def __init__(self, category, amount):
+        self.category = category
+        self.amount = amount
+
+class Goal:
+    __slots__ = ('id', 'name', 'target_amount', 'deadline', 'category', 'bucket_ids')
+
+    def __init__(self, id, name, target_amount, deadline, category, bucket_ids=()):
+        self.id = id
+        self.name = name
+        self.target_amount = target_amount
+        self.deadline = deadline
+        self.category = category
+        self.bucket_ids = list(bucket_ids)
+
+class Features:
+    """Compact summary of a user's finances that tips are chosen from"""
+    __slots__ = ('month', 'total_assets', 'investment_ratio', 'idle_cash_share', 'overspent', 'goals_at_risk',
+                 'tips')
+
+    def __init__(self, month, total_assets, investment_ratio, idle_cash_share, overspent, goals_at_risk):
+        self.month = month
+        self.total_assets = total_assets
+        self.investment_ratio = investment_ratio
+        self.idle_cash_share = idle_cash_share
+        self.overspent = overspent
+        self.goals_at_risk = goals_at_risk
+        # Filled in by tips.py the first time a tip is needed
+        self.tips = None
+
+# Goals this close to their deadline and not yet reached are at risk
+GOAL_RISK_DAYS = 90
+
+class UserData:
+    """In-memory copy of a user's buckets, budget and goals
+
+    Mutators write to the database and to this copy together. The database
+    keeps a per-user change counter; each mutator bumps it by exactly one, so
+    a counter that moved further means another session wrote as well and the
+    copy is reloaded.
+    """
+    __slots__ = ('user_id', 'version', 'expenses_version', 'buckets', 'budgets', 'goals', '_frames', '_features')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.load()
+
+    def load(self):
+        """Read the user's buckets, budget and goals from the database"""
+        self.version, self.expenses_version = db.get_data_versions(self.user_id)
+        self.buckets = {
+            int(row.id): Bucket(int(row.id), row.name, float(row.amount), row.type, row.currency)
+            for row in db.get_buckets(self.user_id).itertuples()
+        }
+        self.budgets = {
+            row.category: Budget(row.category, float(row.amount))
+            for row in db.get_budget(self.user_id).itertuples()
+        }
+        self.goals = {
+            int(row.id): Goal(int(row.id), row.name, float(row.target_amount), row.deadline, row.category)
+            for row in db.get_goals(self.user_id).itertuples()
+        }
+        for goal_id, bucket_id in db.get_goal_links(self.user_id):
+            if goal_id in self.goals and bucket_id in self.buckets:
+                self.goals[goal_id].bucket_ids.append(bucket_id)
+        self._frames = {}
+        self._features = None
+
+    def refresh(self):
+        """Reload if another session changed the user's data"""
+        version, expenses_version = db.get_data_versions(self.user_id)
+        if version != self.version:
+            self.load()
+        elif expenses_version != self.expenses_version:
+            # Expenses are not held here, only the features derived from them
+            self.expenses_version = expenses_version
+            self._features = None
+
+    def _wrote(self):
+        # Called after each of our own writes, once the copy has been updated
+        self._frames = {}
+        self._features = None
+        version, expenses_version = db.get_data_versions(self.user_id)
+        if version != self.version + 1:
+            self.load()
+        else:
+            self.version, self.expenses_version = version, expenses_version
+        for hook in _refresh_hooks:
+            hook(self)
+
+    # Frames in the same shape and dtypes as the database getters
+    def buckets_frame(self):
+        if 'buckets' not in self._frames:
+            self._frames['buckets'] = db.frame_from_rows(
+                [(b.id, b.name, b.amount, b.type, b.currency) for b in self.buckets.values()],
+                db.named_dtypes(db.BUCKET_COLUMNS))
+        return self._frames['buckets']
+
+    def budget_frame(self):
+        if 'budget' not in self._frames:
+            self._frames['budget'] = db.frame_from_rows(
+                [(b.category, b.amount) for b in self.budgets.values()], db.named_dtypes(db.BUDGET_COLUMNS))
+        return self._frames['budget']
+
+    def goals_frame(self):
+        if 'goals' not in self._frames:
+            self._frames['goals'] = db.frame_from_rows(
+                [(g.id, g.name, g.target_amount, g.deadline, g.category) for g in self.goals.values()],
+                db.named_dtypes(db.GOAL_COLUMNS))
+        return self._frames['goals']
+
+    def goal_buckets(self, goal_id):
+        """Get the buckets linked to a goal"""
+        return [self.buckets[bucket_id] for bucket_id in self.goals[int(goal_id)].bucket_ids]
+
+    def goal_current_amount(self, goal_id):
+        """Sum the amounts of the buckets linked to a goal in the base currency"""
+        buckets = self.goal_buckets(goal_id)
+        return float(currency.to_base([b.amount for b in buckets], [b.currency for b in buckets]).sum())
+
+    def features(self):
+        """Get the user's features, computed once per change to their data or per month"""
+        month = datetime.now().strftime('%Y-%m')
+        if self._features is None or self._features.month != month:
+            self._features = self._compute_features(month)
+        return self._features
+
+    def _compute_features(self, month):
+        buckets = list(self.buckets.values())
+        amounts = currency.to_base([b.amount for b in buckets], [b.currency for b in buckets]).fillna(0)
+        types = pd.Series([b.type for b in buckets], dtype=object)
+        total = amounts.sum()
+        investment_ratio = amounts[types.isin(['RRSP', 'TFSA']).to_numpy()].sum() / total if total > 0 else 0.0
+        idle_cash_share = amounts[(types == 'Cash').to_numpy()].sum() / total if total > 0 else 0.0
+
+        spent = db.get_month_totals(self.user_id, month)
+        overspent = tuple(sorted(
+            (category, spent[category], budget.amount)
+            for category, budget in self.budgets.items()
+            if budget.amount > 0 and spent.get(category, 0) > budget.amount
+        ))
+
+        today = pd.Timestamp.now()
+        goals_at_risk = tuple(
+            goal.name for goal in self.goals.values()
+            if (goal.deadline - today).days <= GOAL_RISK_DAYS
+            and self.goal_current_amount(goal.id) < goal.target_amount
+        )
+        return Features(month, float(total), float(investment_ratio), float(idle_cash_share), overspent, goals_at_risk)
+
+    # Write-through mutators
+    def add_bucket(self, name, amount, bucket_type, bucket_currency=currency.BASE_CURRENCY):
+        bucket_id = db.add_bucket(self.user_id, name, amount, bucket_type, bucket_currency)
+        self.buckets[bucket_id] = Bucket(bucket_id, name, float(amount), bucket_type, bucket_currency)
+        self._wrote()
+
+    def update_bucket(self, bucket_id, amount):
+        db.update_bucket(bucket_id, amount, self.user_id)
+        self.buckets[int(bucket_id)].amount = float(amount)
+        self._wrote()
+
+    def set_budget(self, category, amount):
+        db.set_budget(self.user_id, category, amount)
+        self.budgets[category] = Budget(category, float(amount))
+        self._wrote()
+
+    def delete_budget(self, category):
+        db.delete_budget(self.user_id, category)
+        self.budgets.pop(category, None)
+        self._wrote()
+
+    def add_goal(self, name, target_amount, deadline, category):
+        goal_id = db.add_goal(self.user_id, name, target_amount, deadline, category)
+        self.goals[goal_id] = Goal(goal_id, name, float(target_amount), pd.Timestamp(deadline), category)
+        self._wrote()
+        return goal_id
+
+    def link_goal_to_buckets(self, goal_id, bucket_ids):
+        db.link_goal_to_buckets(goal_id, bucket_ids, self.user_id)
+        self.goals[int(goal_id)].bucket_ids = [int(bucket_id) for bucket_id in bucket_ids]
+        self._wrote()
+
+# Functions called with a UserData after each of its writes and after it is
+# prefetched, registered by modules that keep figures derived from it
+_refresh_hooks = []
+
+def on_refresh(func):
+    """Register a function to call with a UserData whenever its data is written or prefetched"""
+    _refresh_hooks.append(func)
+    return func
+
+def prefetch(user_id):
+    """Load a user's data and start warming the caches their pages read
+
+    The data is ready as soon as this returns; the rest of the warming runs
+    as its own job, so a session waiting for the data doesn't wait for it.
+    """
+    data = UserData(user_id)
+    data.features()
+    # The hooks get a copy, as the session may change the data meanwhile
+    _prefetch_executor.submit(warm_caches, copy.deepcopy(data))
+    return data
+
+def warm_caches(data):
+    """Load the exchange rates and categorizer model and run the refresh hooks for a user's data"""
+    try:
+        currency.get_rates()
+        categorizer.get_model(data.user_id)
+        for hook in _refresh_hooks:
+            hook(data)
+    except Exception:
+        logger.exception("Warming caches failed for user %s", data.user_id)
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='prefetch')
+_prefetches = {}
+_prefetch_lock = threading.Lock()
+
+def start_prefetch(user_id):
+    """Start prefetching a user's data in the background, once until a session picks it up"""
+    with _prefetch_lock:
+        if len(_prefetches) >= 1000:
+            # Drop prefetches no session picked up
+            for key in [key for key, future in _prefetches.items() if future.done()]:
+                del _prefetches[key]
+        if user_id not in _prefetches:
+            _prefetches[user_id] = _prefetch_executor.submit(prefetch, user_id)
+
+def get_user_data():
+    """Get the logged-in user's data, loading it once per session and reloading only when stale
+
+    A prefetch started at login is waited for rather than loading twice.
+    """
+    user_id = st.session_state.user['id']
+    data = st.session_state.get('user_data')
+    if data is None or data.user_id != user_id:
+        with _prefetch_lock:
+            future = _prefetches.pop(user_id, None)
+        data = None
+        if future is not None:
+            try:
+                data = future.result()
+                data.refresh()
+            except Exception:
+                logger.exception("Prefetch failed for user %s", user_id)
+                data = None
+        if data is None:
+            data = UserData(user_id)
+        st.session_state.user_data = data
+    else:
+        data.refresh()
+    return data
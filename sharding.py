@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import storage
+from concurrent.futures import ThreadPoolExecutor
+
+# The user directory (users table) always lives in DB_PATH. Per-user data
+# (buckets, expenses, budget, goals) is spread over SHARD_COUNT files.
+# With a single shard the directory file doubles as shard 0, which keeps
+# existing single-file installs working unchanged.
+DB_PATH = os.environ.get('FINANCE_DB_PATH', 'finance.db')
+SHARD_COUNT = int(os.environ.get('FINANCE_DB_SHARDS', 1))
+
+def shard_for_user(user_id, shard_count=None):
+    """Map a user id to its shard index"""
+    shard_count = shard_count or SHARD_COUNT
+    return int(user_id) % shard_count
+
+def shard_path(index, shard_count=None):
+    """Get the database file holding a shard"""
+    shard_count = shard_count or SHARD_COUNT
+    if shard_count == 1:
+        return DB_PATH
+    stem, ext = os.path.splitext(DB_PATH)
+    return f"{stem}.shard{index}{ext or '.db'}"
+
+def connect_path(path):
+    """Open a connection to a database through the storage backend"""
+    conn = storage.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def connect_directory():
+    """Connect to the user directory database"""
+    return connect_path(DB_PATH)
+
+def connect_shard(index, shard_count=None):
+    """Connect to a shard database"""
+    return connect_path(shard_path(index, shard_count))
+
+def all_paths(shard_count=None):
+    """Get the directory path followed by every distinct shard path"""
+    shard_count = shard_count or SHARD_COUNT
+    paths = [DB_PATH]
+    for index in range(shard_count):
+        path = shard_path(index, shard_count)
+        if path not in paths:
+            paths.append(path)
+    return paths
+
+def map_shards(func, max_workers=None):
+    """Run func(shard_index) on every shard in parallel and return results in shard order"""
+    max_workers = max_workers or SHARD_COUNT
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, range(SHARD_COUNT)))
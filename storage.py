@@ -0,0 +1,310 @@
+import contextlib
+import datetime
+import itertools
+import os
+import sqlite3
+import threading
+
+# Storage backends decide how a database name from sharding.py is opened.
+# The functions in database.py are the data interface the pages use; every
+# backend speaks SQLite's SQL, so backends plug in below them, at the
+# connection. Select one with FINANCE_DB_BACKEND, or call use_backend() before init_db()
+# in benchmarks and load tests.
+BACKENDS = {}
+
+def register_backend(name):
+    """Register a backend class under a configuration name"""
+    def decorator(cls):
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+@register_backend('sqlite')
+class SQLiteFileBackend:
+    """Each database name is a SQLite file on disk"""
+
+    def connect(self, name):
+        return sqlite3.connect(name, timeout=30)
+
+@register_backend('memory')
+class SQLiteMemoryBackend:
+    """Each database name is an in-memory SQLite database shared by its connections
+
+    The memdb VFS shares one database between connections through ordinary
+    file locks, so writers wait out the busy timeout as they do on disk;
+    a shared cache would fail them at once with "database table is locked".
+    """
+
+    def __init__(self):
+        # An in-memory database is dropped when its last connection closes,
+        # so keep one open per name for the lifetime of the backend
+        self._anchors = {}
+        self._lock = threading.Lock()
+
+    def _uri(self, name):
+        return f"file:/{os.path.basename(name)}?vfs=memdb"
+
+    def connect(self, name):
+        uri = self._uri(name)
+        with self._lock:
+            if uri not in self._anchors:
+                self._anchors[uri] = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return sqlite3.connect(uri, uri=True, timeout=30)
+
+    def close(self):
+        """Drop every in-memory database"""
+        with self._lock:
+            for conn in self._anchors.values():
+                conn.close()
+            self._anchors.clear()
+
+@register_backend('libsql')
+class LibSQLBackend:
+    """Each database name is a libSQL database, as served by sqld or Turso
+
+    FINANCE_LIBSQL_URL is the server URL, with {name} standing for the
+    database name's file stem (finance, finance.shard0, ...), and
+    FINANCE_LIBSQL_AUTH_TOKEN its token. Each connection is an embedded
+    replica in the local file, synced on connect, whose writes go to the
+    server. Without a URL the libSQL engine runs on the local files alone,
+    which stands in for the server in benchmarks and load tests.
+
+    The driver keeps the GIL while SQLite waits out a lock, so a writer
+    waiting on another thread's transaction would stall that thread too.
+    Write transactions on a database are therefore taken in turn, one
+    process-wide lock per name, and only reach SQLite's lock uncontended.
+    """
+
+    def __init__(self):
+        import libsql_experimental
+        self._libsql = libsql_experimental
+        self.url = os.environ.get('FINANCE_LIBSQL_URL')
+        self.auth_token = os.environ.get('FINANCE_LIBSQL_AUTH_TOKEN', '')
+        self._write_locks = {}
+        self._lock = threading.Lock()
+
+    def _write_lock(self, name):
+        with self._lock:
+            return self._write_locks.setdefault(os.path.abspath(name), threading.Lock())
+
+    def connect(self, name):
+        errors = (ValueError, self._libsql.Error)
+        with sqlite_errors(errors):
+            if self.url:
+                stem = os.path.splitext(os.path.basename(name))[0]
+                conn = self._libsql.connect(name, sync_url=self.url.format(name=stem),
+                                            auth_token=self.auth_token)
+                conn.sync()
+            else:
+                conn = self._libsql.connect(name)
+            conn.execute('PRAGMA busy_timeout = 30000')
+            # libSQL enforces foreign keys by default, but sharded rows point
+            # at users kept in the directory file, so match sqlite3 and don't
+            conn.execute('PRAGMA foreign_keys = OFF')
+        return LibSQLConnection(conn, errors, self._write_lock(name))
+
+# libSQL speaks SQLite's SQL, so database.py runs on it unchanged; the
+# classes below give its connections the parts of the sqlite3 interface
+# the app relies on: name-indexed rows, cursor iteration, `with conn:`
+# transactions and sqlite3's exception types.
+
+@contextlib.contextmanager
+def sqlite_errors(errors):
+    """Re-raise a driver's errors as the sqlite3 exceptions callers catch"""
+    try:
+        yield
+    except errors as e:
+        if 'constraint failed' in str(e):
+            raise sqlite3.IntegrityError(str(e)) from e
+        raise sqlite3.OperationalError(str(e)) from e
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+# Statements that start a write transaction or need the write lock
+LOCKING_STATEMENTS = WRITE_STATEMENTS + ('BEGIN', 'CREATE', 'DROP', 'ALTER')
+# Seconds to wait for another connection's write transaction, as busy_timeout
+WRITE_LOCK_TIMEOUT = 30
+
+def sqlite_parameters(parameters):
+    """Convert dates the way sqlite3's default adapters do"""
+    return tuple(value.isoformat(' ') if isinstance(value, datetime.datetime)
+                 else value.isoformat() if isinstance(value, datetime.date)
+                 else value
+                 for value in parameters)
+
+class LibSQLRow(tuple):
+    """A result row readable by position or column name, like sqlite3.Row"""
+
+    def __new__(cls, values, columns):
+        row = super().__new__(cls, values)
+        row._columns = columns
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._columns.index(key)
+        return super().__getitem__(key)
+
+    def keys(self):
+        return list(self._columns)
+
+class LibSQLCursor:
+    def __init__(self, connection, cursor, row_factory, errors):
+        self._connection = connection
+        self._cursor = cursor
+        self._errors = errors
+        self._returned = None
+        self.row_factory = row_factory
+
+    def execute(self, sql, parameters=()):
+        if sql.lstrip().upper().startswith(LOCKING_STATEMENTS):
+            self._connection.begin_writing()
+        with sqlite_errors(self._errors):
+            self._cursor.execute(sql, sqlite_parameters(parameters))
+            # libSQL won't commit while a write's RETURNING rows are unread,
+            # so read them now, as SQLite does for sqlite3
+            self._returned = (iter(self._cursor.fetchall() or [])
+                              if sql.lstrip().upper().startswith(WRITE_STATEMENTS) else None)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._connection.begin_writing()
+        with sqlite_errors(self._errors):
+            self._cursor.executemany(sql, [sqlite_parameters(parameters) for parameters in seq_of_parameters])
+        return self
+
+    def _make_row(self, values):
+        if values is None or self.row_factory is None:
+            return values
+        if self.row_factory is sqlite3.Row:
+            return LibSQLRow(values, [column[0] for column in self._cursor.description])
+        return self.row_factory(self, values)
+
+    def fetchone(self):
+        if self._returned is not None:
+            return self._make_row(next(self._returned, None))
+        with sqlite_errors(self._errors):
+            return self._make_row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        if self._returned is not None:
+            rows = list(itertools.islice(self._returned, size or self._cursor.arraysize))
+        else:
+            with sqlite_errors(self._errors):
+                rows = self._cursor.fetchmany(size or self._cursor.arraysize)
+        return [self._make_row(row) for row in rows]
+
+    def fetchall(self):
+        if self._returned is not None:
+            rows = list(self._returned)
+        else:
+            with sqlite_errors(self._errors):
+                rows = self._cursor.fetchall()
+        return [self._make_row(row) for row in rows]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+class LibSQLConnection:
+    def __init__(self, conn, errors, write_lock):
+        self._conn = conn
+        self._errors = errors
+        self._write_lock = write_lock
+        self._writing = False
+        self.row_factory = None
+
+    def begin_writing(self):
+        """Take the database's write lock until this connection commits, rolls back or closes"""
+        if self._writing:
+            return
+        if not self._write_lock.acquire(timeout=WRITE_LOCK_TIMEOUT):
+            raise sqlite3.OperationalError('database is locked')
+        self._writing = True
+
+    def _done_writing(self):
+        if self._writing and not self._conn.in_transaction:
+            self._writing = False
+            self._write_lock.release()
+
+    def cursor(self):
+        return LibSQLCursor(self, self._conn.cursor(), self.row_factory, self._errors)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def commit(self):
+        try:
+            with sqlite_errors(self._errors):
+                self._conn.commit()
+        finally:
+            self._done_writing()
+
+    def rollback(self):
+        try:
+            with sqlite_errors(self._errors):
+                self._conn.rollback()
+        finally:
+            self._done_writing()
+
+    def close(self):
+        try:
+            self._conn.close()
+        finally:
+            if self._writing:
+                self._writing = False
+                self._write_lock.release()
+
+    def backup(self, *args, **kwargs):
+        raise sqlite3.NotSupportedError("libSQL databases are backed up on the server, not through the app")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+_backend = None
+
+def get_backend():
+    """Get the active backend, creating the configured one on first use"""
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[os.environ.get('FINANCE_DB_BACKEND', 'sqlite')]()
+    return _backend
+
+def use_backend(name):
+    """Switch to another backend; call database.init_db() afterwards"""
+    global _backend
+    if _backend is not None and hasattr(_backend, 'close'):
+        _backend.close()
+    _backend = BACKENDS[name]()
+    return _backend
+
+def connect(name):
+    """Open a connection to a database through the active backend"""
+    return get_backend().connect(name)
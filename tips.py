@@ -1,6 +1,7 @@
 import streamlit as st
 import random
 from typing import Dict, List
+import session_data
 
 # Financial tips database organized by context
 TIPS_DATABASE = {
@@ -35,9 +36,72 @@ def get_contextual_tip(context: str = "general") -> Dict[str, str]:
         "context": context
     }
 
+# Rules matching a user's features, each with the tip it produces
+INVESTMENT_TARGET = 0.4
+IDLE_CASH_LIMIT = 0.3
+
+def _overspent_tip(features):
+    categories = [category for category, _, _ in features.overspent]
+    over = sum(spent - budget for _, spent, budget in features.overspent)
+    return f"📊 You're ${over:,.2f} over budget this month in {', '.join(categories)}. Look there first for cuts."
+
+def _goals_at_risk_tip(features):
+    return (f"⏳ {', '.join(features.goals_at_risk)} {'is' if len(features.goals_at_risk) == 1 else 'are'} "
+            f"close to the deadline and not funded yet. Link more buckets or move the date.")
+
+def _idle_cash_tip(features):
+    return (f"💤 {features.idle_cash_share:.0%} of your money sits in cash. "
+            f"Keep an emergency fund and put the rest to work.")
+
+def _investment_ratio_tip(features):
+    return (f"📈 Only {features.investment_ratio:.0%} of your money is in RRSP and TFSA accounts. "
+            f"Aim for {INVESTMENT_TARGET:.0%} or more.")
+
+RULES = {
+    'overspent': (lambda f: bool(f.overspent), _overspent_tip),
+    'goals_at_risk': (lambda f: bool(f.goals_at_risk), _goals_at_risk_tip),
+    'idle_cash': (lambda f: f.idle_cash_share > IDLE_CASH_LIMIT, _idle_cash_tip),
+    'investment_ratio': (lambda f: f.total_assets > 0 and f.investment_ratio < INVESTMENT_TARGET, _investment_ratio_tip),
+}
+
+# Rules to try for each context, most relevant first
+CONTEXT_RULES = {
+    "budgeting": ['overspent', 'goals_at_risk'],
+    "investing": ['idle_cash', 'investment_ratio'],
+    "savings": ['goals_at_risk', 'investment_ratio', 'idle_cash'],
+    "general": ['overspent', 'goals_at_risk', 'idle_cash', 'investment_ratio'],
+}
+
+def choose_tips(features) -> Dict[str, str]:
+    """Evaluate the rules once and pick the personal tip for every context that has one"""
+    matched = {name: tip(features) for name, (applies, tip) in RULES.items() if applies(features)}
+    chosen = {}
+    for context, names in CONTEXT_RULES.items():
+        for name in names:
+            if name in matched:
+                chosen[context] = matched[name]
+                break
+    return chosen
+
+def get_personal_tip(context: str = "general") -> Dict[str, str]:
+    """Get the logged-in user's tip for a context, falling back to a random general one
+
+    Tips are chosen when the user's features are computed, so this is a
+    dictionary lookup on every rerun until their data changes.
+    """
+    features = session_data.get_user_data().features()
+    if features.tips is None:
+        features.tips = choose_tips(features)
+    tip = features.tips.get(context)
+    if tip is None:
+        return get_contextual_tip(context)
+    return {
+        "text": tip,
+        "context": context
+    }
+
 def show_tip_widget(context: str = "general"):
     """Display a floating tip widget"""
-    tip = get_contextual_tip(context)
 
     # Initialize session state for tip visibility
     if 'tip_visible' not in st.session_state:
@@ -80,7 +144,7 @@ def show_tip_widget(context: str = "general"):
 
         # Show tip if visible
         if st.session_state.tip_visible:
-            st.info(tip['text'])
+            st.info(get_personal_tip(context)['text'])
 
 def get_context_from_page(page_name: str) -> str:
     """Determine the tip context based on the current page"""
@@ -1,3 +1,5 @@
+import streamlit as st
+from streamlit.errors import StreamlitAPIException
 from datetime import datetime
 
 def format_currency(amount):
@@ -8,3 +10,10 @@ def get_current_month():
 
 def calculate_percentage(part, whole):
     return (part / whole * 100) if whole != 0 else 0
+
+def rerun_fragment():
+    """Rerun the calling fragment, or the whole app when this run is not a fragment rerun"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()